@@ -0,0 +1,77 @@
+"""Measure the memory held for channels after churn, with and without the
+dormant channel sweep.
+
+The bot joins <channels> channels and a pomodoro is run and voted on in each,
+then the clock moves past dormant_after and every session has ended. The bytes
+held by the channel table are reported before and after evict_dormant, and the
+bot is made to part half the channels to check they are dropped as well.
+
+Usage: python benchmarks/channel_memory.py [channels]"""
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pomodoro_bot import PomodoroCommands
+from pomodoro_bot.replay import Event, ReplayConnection, Source, VirtualClock
+
+
+def message(nick, text, target):
+    return Event("pubmsg", Source(nick), target, [text])
+
+
+def advance(bot, clock, seconds):
+    clock.now += seconds
+    bot._scheduler.run_due()
+
+
+def churn(bot, clock, channels):
+    """Run one pomodoro with a vote in each of <channels> new channels, the
+    phases driven by the scheduler on the virtual clock."""
+    connection = bot.connection
+    names = ["#churn" + str(number) for number in range(channels)]
+    for channel in names:
+        bot.join_channel(connection, channel)
+        bot.do_pub_pomodoro(connection, message("alice", ".pomodoro fast",
+                                                channel))
+        bot.do_pub_register(connection, message("alice", ".register Reading",
+                                                channel))
+    advance(bot, clock, 300)
+    advance(bot, clock, 25 * 60)
+    for channel in names:
+        bot._channel_table[channel].vote("long", "alice")
+    advance(bot, clock, 5 * 60)
+
+
+def main():
+    channels = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    clock = VirtualClock(1460000000.0)
+    bot = PomodoroCommands("controller", "PomodoroBot",
+                           ReplayConnection("PomodoroBot"), "127.0.0.1",
+                           work_logs=tempfile.mkdtemp(prefix="channels-"),
+                           io_workers=0, clock=clock)
+    bot._outbox.notice = lambda *arguments: None
+    tracemalloc.start()
+    churn(bot, clock, channels)
+    after_churn = tracemalloc.get_traced_memory()[0]
+    clock.now += bot._dormant_after
+    evicted = bot.evict_dormant()
+    after_sweep = tracemalloc.get_traced_memory()[0]
+    connection = bot.connection
+    for number in range(0, channels, 2):
+        bot.do_part(connection, message("controller", "part #churn"
+                                        + str(number), None))
+    after_part = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("channels:         ", channels)
+    print("after churn:      ", after_churn // 1024, "KiB")
+    print("after the sweep:  ", after_sweep // 1024, "KiB,", evicted,
+          "channels dormant")
+    print("after parting half:", after_part // 1024, "KiB,",
+          len(bot._channel_table), "channels left")
+
+
+if __name__ == "__main__":
+    main()
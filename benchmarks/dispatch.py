@@ -0,0 +1,63 @@
+"""Measure how many channel messages per second PomodoroCommands.on_pubmsg
+handles for a realistic ratio of chatter to commands.
+
+Usage: python benchmarks/dispatch.py [messages] [command ratio]"""
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pomodoro_bot import PomodoroCommands, Pomodoro, MessageQueue
+from pomodoro_bot.replay import Event, ReplayConnection, Source
+
+
+CHATTER = ["anyone around?", "lol", "I think the build is broken again",
+           "brb coffee", "pomodoros are great for focus", "ok back",
+           "has anyone read the new paper on attention?", ":)", "hmm",
+           "PomodoroBot is nice", "registered users get a cookie"]
+COMMANDS = [".registered", ".help", ".help register", ".export",
+            "PomodoroBot: help", ".who"]
+
+
+def workload(count, ratio, seed=0):
+    rng = random.Random(seed)
+    events = []
+    for index in range(count):
+        text = rng.choice(COMMANDS if rng.random() < ratio else CHATTER)
+        events.append(Event("pubmsg", Source("user" + str(rng.randint(0, 50))),
+                            "#test", [text]))
+    return events
+
+
+def run(bot, connection, events):
+    start = time.perf_counter()
+    for event in events:
+        bot.on_pubmsg(connection, event)
+    return len(events) / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    os.chdir(tempfile.mkdtemp())
+    connection = ReplayConnection("PomodoroBot")
+    bot = PomodoroCommands("controller", "PomodoroBot", connection,
+                           "127.0.0.1")
+    bot._outbox = MessageQueue(connection)
+    bot._channel_table["#test"] = Pomodoro(bot._outbox, "#test",
+                                           bot._scheduler)
+    for label, events in (("mixed (" + str(ratio) + " commands)",
+                           workload(count, ratio)),
+                          ("chatter only", workload(count, 0)),
+                          ("commands only", workload(count // 10, 1))):
+        rate = run(bot, connection, events)
+        # Keep the unsent replies from piling up between runs.
+        bot._outbox = MessageQueue(connection)
+        print(label.ljust(26), str(int(rate)).rjust(10), "messages/s")
+
+
+if __name__ == "__main__":
+    main()
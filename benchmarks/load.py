@@ -0,0 +1,162 @@
+"""Synthetic load against PomodoroBot without an IRC server.
+
+The controller joins N channels, then M users in each channel issue .pomodoro,
+.register, .registered, votes and plain chatter at the given rate. Messages are
+driven through replay.Replayer, so the bot talks to a stand-in connection and
+runs on a virtual clock: phase timers fire at their deadlines without any real
+waiting, and only the time spent handling messages is measured.
+
+Reported are the handling throughput, p50/p99 latency overall and per command,
+the phase transitions and notices produced, the bytes written to the logbook
+and the peak RSS of the process. The results are printed as JSON, and written
+to --output as well so runs can be compared between releases.
+
+Usage: python benchmarks/load.py [--channels N] [--users M] [--minutes T]
+                                 [--rate R] [--output results.json]"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pomodoro_bot.replay import Replayer
+
+
+CHATTER = ["anyone around?", "lol", "brb coffee", "ok back", ":)", "hmm",
+           "I think the build is broken again", "pomodoros are great for focus"]
+GOALS = ["Writing my thesis.", "Learning rust.", "Homework", "Reading",
+         "Programming a Pomodoro IRC Bot.", "Taxes", "Practicing piano"]
+MODES = ["fast", "long", "lazy"]
+# Relative weight of each kind of message a user sends.
+MIX = {"chatter": 60, "register": 15, "registered": 10, "pomodoro": 5,
+       "vote": 10}
+
+
+def message(kind, rng):
+    if kind == "chatter":
+        return rng.choice(CHATTER)
+    if kind == "register":
+        return ".register " + rng.choice(GOALS)
+    if kind == "registered":
+        return ".registered"
+    # A .pomodoro starts a session in an idle channel and is a vote during a
+    # break, the bot tells them apart by the channel's state.
+    return ".pomodoro " + rng.choice(MODES)
+
+
+def workload(channels, users, minutes, rate, start=1460000000, seed=0):
+    """Yield (kind, record) pairs of a synthetic recording. Messages arrive
+    as a Poisson process of <rate> messages per user per minute."""
+    rng = random.Random(seed)
+    kinds = list(MIX)
+    weights = [MIX[kind] for kind in kinds]
+    names = ["#load" + str(channel) for channel in range(channels)]
+    for name in names:
+        yield "join", (start, "privmsg", "controller", "join " + name,
+                       "PomodoroBot")
+    total_rate = channels * users * rate / 60.0
+    now = start
+    end = start + minutes * 60
+    while True:
+        now += rng.expovariate(total_rate)
+        if now >= end:
+            break
+        kind = rng.choices(kinds, weights)[0]
+        nick = "user" + str(rng.randrange(users))
+        yield kind, (now, "pubmsg", nick, message(kind, rng),
+                     rng.choice(names))
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_summary(samples):
+    samples.sort()
+    return {"count": len(samples),
+            "p50_us": round(percentile(samples, 0.5) * 1e6, 2),
+            "p99_us": round(percentile(samples, 0.99) * 1e6, 2),
+            "max_us": round(samples[-1] * 1e6, 2)}
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, name))
+               for name in os.listdir(path))
+
+
+def run(channels, users, minutes, rate, seed=0):
+    work_logs = tempfile.mkdtemp(prefix="load-")
+    replayer = Replayer(work_logs)
+    latencies = {}
+    handling = 0
+    for kind, record in workload(channels, users, minutes, rate, seed=seed):
+        if replayer._bot is not None:
+            # Fire the phase timers due before the message outside the
+            # measurement.
+            replayer.advance(record[0])
+        start = time.perf_counter()
+        replayer.feed(*record)
+        elapsed = time.perf_counter() - start
+        handling += elapsed
+        latencies.setdefault(kind, []).append(elapsed)
+    logbook = replayer._bot._logbook
+    logbook.flush()
+    journal_bytes = directory_bytes(work_logs)
+    logbook.compact()
+    logbook.flush()
+    compacted_bytes = directory_bytes(work_logs)
+    report = replayer.report(handling)
+    everything = [sample for samples in latencies.values()
+                  for sample in samples]
+    return {"parameters": {"channels": channels, "users": users,
+                           "minutes": minutes, "rate": rate, "seed": seed},
+            "python": platform.python_version(),
+            "messages": report["events"],
+            "errors": report["errors"],
+            "messages_per_second": report["events_per_second"],
+            "latency": latency_summary(everything),
+            "latency_by_command": {kind: latency_summary(samples)
+                                   for kind, samples in sorted(latencies.items())},
+            "phase_transitions": report["phase_transitions"],
+            "notices_sent": report["notices_sent"],
+            "notice_bytes": report["notice_bytes"],
+            "logbook": {"nicks": report["logbook"]["nicks"],
+                        "sessions": report["logbook"]["sessions"],
+                        "journal_bytes": journal_bytes,
+                        "compacted_bytes": compacted_bytes},
+            # ru_maxrss is in kilobytes on Linux.
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Drive PomodoroBot with synthetic channel traffic.")
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--users", type=int, default=50,
+                        help="Users per channel.")
+    parser.add_argument("--minutes", type=float, default=240,
+                        help="Virtual minutes of traffic to generate.")
+    parser.add_argument("--rate", type=float, default=0.5,
+                        help="Messages per user per minute.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the results to this file.")
+    arguments = parser.parse_args(argv)
+    results = run(arguments.channels, arguments.users, arguments.minutes,
+                  arguments.rate, arguments.seed)
+    text = json.dumps(results, indent=2)
+    print(text)
+    if arguments.output:
+        with open(arguments.output, "w") as output:
+            output.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
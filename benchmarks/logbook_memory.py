@@ -0,0 +1,69 @@
+"""Compare the memory used by a synthetic 1M-session logbook stored as the
+old list of Session namedtuples and as the columnar SessionLog.
+
+Usage: python benchmarks/logbook_memory.py [sessions]"""
+import os
+import sys
+import time
+import random
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pomodoro_bot import Pomodoro, Session, SessionLog
+
+
+GOALS = ["Writing my thesis.", "Learning rust.", "Homework", "Reading",
+         "Programming a Pomodoro IRC Bot.", "Taxes", "Practicing piano", ""]
+
+
+def synthetic_sessions(count, seed=0):
+    """Yield <count> (epoch, type, goal) session triples."""
+    rng = random.Random(seed)
+    modes = list(Pomodoro._modes)
+    epoch = 1400000000
+    for _ in range(count):
+        epoch += rng.randint(1800, 86400)
+        # Goals come off the wire as fresh strings, so don't share the
+        # literals between sessions.
+        goal = " " + rng.choice(GOALS)
+        yield epoch, rng.choice(modes), goal
+
+
+def measure(build, count):
+    """Return the bytes still allocated by the result of build(count)."""
+    tracemalloc.start()
+    result = build(count)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def build_tuples(count):
+    return [Session(time.strftime("%Y-%m-%dT%H-%M-%SZ", time.gmtime(epoch)),
+                    type, goal)
+            for epoch, type, goal in synthetic_sessions(count)]
+
+
+def build_columns(count):
+    session_log = SessionLog()
+    for epoch, type, goal in synthetic_sessions(count):
+        session_log.append(epoch, type, goal)
+    return session_log
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    old = measure(build_tuples, count)
+    new = measure(build_columns, count)
+    print("sessions:          ", count)
+    print("namedtuple layout: ", round(old / 2**20, 1), "MiB",
+          "(" + str(round(old / count, 1)), "bytes/session)")
+    print("columnar layout:   ", round(new / 2**20, 1), "MiB",
+          "(" + str(round(new / count, 1)), "bytes/session)")
+    print("reduction:         ", str(round(old / new, 1)) + "x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Measure how long a warm restart from a channel snapshot takes.
+
+A bot is given <channels> channels with <users> registered users each, spread
+over every phase of a pomodoro. Its snapshot is saved, then a second bot is
+started from that snapshot, which restores every channel and schedules its
+pending phase at the saved deadline.
+
+Usage: python benchmarks/snapshot.py [channels] [users]"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pomodoro_bot import PomodoroBot, Pomodoro
+
+
+def populate(bot, channels, users):
+    now = bot._scheduler.now()
+    for number in range(channels):
+        channel = "#channel" + str(number)
+        session = Pomodoro(bot._outbox, channel, bot._scheduler)
+        session.initialize_pomodoro("fast", delay=number % 300)
+        for user in range(users):
+            session.register_nick("user" + str(user), "Working on task "
+                                  + str(user))
+        if number % 3 == 1:
+            session._deadline = now
+            session.pomodoro_start("fast")
+        elif number % 3 == 2:
+            session._deadline = now
+            session.pomodoro_break("fast")
+            session.vote("long", "user0")
+        bot._channel_table[channel] = session
+
+
+def main():
+    channels = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    directory = tempfile.mkdtemp(prefix="snapshot-")
+    path = os.path.join(directory, ".snapshot.json")
+    options = {"work_logs": directory, "io_workers": 0, "snapshot": path}
+    bot = PomodoroBot("controller", "PomodoroBot", "localhost", "127.0.0.1",
+                      **options)
+    populate(bot, channels, users)
+    start = time.perf_counter()
+    bot.save_snapshot()
+    saved = time.perf_counter() - start
+    start = time.perf_counter()
+    restarted = PomodoroBot("controller", "PomodoroBot", "localhost",
+                            "127.0.0.1", **options)
+    restored = time.perf_counter() - start
+    assert restarted.snapshot()["channels"] == bot.snapshot()["channels"]
+    print("channels:       ", channels, "with", users, "users each")
+    print("snapshot size:  ", os.path.getsize(path) // 1024, "KiB")
+    print("save:            %.1f ms" % (saved * 1000))
+    print("restart:         %.1f ms, %d timers pending"
+          % (restored * 1000, len(restarted._scheduler)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Measure the cold start time of the package's entry points against a budget.
+
+Each scenario is imported in a fresh interpreter <runs> times and the median
+wall time is compared with that of an interpreter which imports nothing. A
+scenario fails if it takes longer than its budget on top of that, or if it
+loads a module it has no business loading, such as the IRC library for code
+which only works with the logbook.
+
+Usage: python benchmarks/startup.py [runs]"""
+import os
+import sys
+import time
+import statistics
+import subprocess
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# (name, statement, budget in ms over a bare interpreter, forbidden modules)
+SCENARIOS = [
+    ("package", "import pomodoro_bot", 10,
+     ("irc", "http", "asyncio", "email")),
+    ("core", "from pomodoro_bot import Pomodoro, WorkLogbook, SessionLog", 40,
+     ("irc", "http", "asyncio", "email", "inspect", "cProfile")),
+    ("recording", "import pomodoro_bot.recording", 20,
+     ("irc", "http", "asyncio")),
+    ("replay", "import pomodoro_bot.replay", 60,
+     ("irc", "http", "asyncio")),
+    ("bot", "from pomodoro_bot import PomodoroBot", 250,
+     ("http.server", "asyncio")),
+    ("cli", "from pomodoro_bot import main", 25,
+     ("irc", "http", "asyncio")),
+]
+
+
+def median_ms(statement, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], cwd=ROOT, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def loaded(statement, forbidden):
+    """Return the <forbidden> packages that <statement> loads."""
+    probe = (statement + "\nimport sys\nprint(' '.join(sorted(sys.modules)))")
+    modules = subprocess.run([sys.executable, "-c", probe], cwd=ROOT,
+                             check=True, capture_output=True,
+                             text=True).stdout.split()
+    return sorted(name for name in forbidden
+                  if any(module == name or module.startswith(name + ".")
+                         for module in modules))
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    baseline = median_ms("pass", runs)
+    print("bare interpreter".ljust(12), ("%.1f ms" % baseline).rjust(9))
+    failed = False
+    for name, statement, budget, forbidden in SCENARIOS:
+        cost = median_ms(statement, runs) - baseline
+        unwanted = loaded(statement, forbidden)
+        ok = cost <= budget and not unwanted
+        failed = failed or not ok
+        print(name.ljust(12), ("+%.1f ms" % cost).rjust(9),
+              ("budget %d ms" % budget).rjust(14), "ok" if ok else "OVER",
+              ("loads " + ", ".join(unwanted)) if unwanted else "")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""An IRC bot which runs pomodoro sessions in channels and keeps a logbook of
+the work done in them.
+
+The names below are imported from their submodules the first time they are
+used, so importing the package, or the core classes, doesn't load the IRC
+library or the HTTP server:
+
+    from pomodoro_bot import Pomodoro, WorkLogbook
+
+core holds everything which doesn't talk to the network, commands the bot's
+command handlers, bot the IRC client which drives them, export_server and aio
+the HTTP export service, and cli the command line entry point, run with
+python -m pomodoro_bot."""
+import importlib
+
+
+_exports = {"PhaseTimer": "core", "PhaseScheduler": "core",
+            "URGENT": "core", "NORMAL": "core", "BULK": "core",
+            "TokenBucket": "core", "MessageQueue": "core",
+            "Pomodoro": "core", "Session": "core", "SessionLog": "core",
+            "Rollup": "core", "SessionStats": "core", "GoalIndex": "core",
+            "WorkLogbook": "core",
+            "PomodoroCommands": "commands", "PomodoroBot": "bot",
+            "main": "cli"}
+
+__all__ = sorted(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError("module " + repr(__name__) + " has no attribute "
+                             + repr(name))
+    value = getattr(importlib.import_module("." + _exports[name], __name__),
+                    name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports))
@@ -0,0 +1,167 @@
+"""Run the bot, its phase timers and the export server on one asyncio loop.
+
+AioPomodoroBot is a PomodoroBot on irc.client_aio's reactor (irc 17 or later),
+so the IRC connection, the phase scheduler, the outbox and the logbook's
+periodic commits are all callbacks on the event loop. AioExportServer answers
+the same requests as the threaded export server, see export_server.Exporter,
+from coroutines, so an idle HTTP connection costs a suspended coroutine rather
+than a thread.
+
+Only the loop's thread handles IRC events and HTTP requests. The logbook's
+files are written by its WorkerPool, and a log an export needs is fetched
+with WorkLogbook.history on an executor thread, which is the only other thread
+using the logbook. The logbook doesn't hold its lock while reading from disk,
+so the loop may wait for the executor thread to add a log to the cache but
+never for the disk.
+
+Started by python -m pomodoro_bot --asyncio."""
+import asyncio
+from email.message import Message
+from email.utils import formatdate
+from http import HTTPStatus
+
+import irc.client
+from irc.client_aio import AioReactor
+from irc.dict import IRCDict
+
+from .export_server import Exporter
+from .export_server import chunked
+from .export_server import unchunked
+from .bot import PomodoroBot
+from .core import Pomodoro
+
+
+class AioPomodoroBot(PomodoroBot):
+    """PomodoroBot driven by an asyncio event loop. A lost connection is
+    retried every reconnect_interval seconds."""
+    reactor_class = AioReactor
+    reconnect_interval = 30
+
+    def execute_every(self, period, function):
+        loop = self.reactor.loop
+
+        def run():
+            loop.call_later(period, run)
+            function()
+        loop.call_later(period, run)
+
+    def _connect(self):
+        self.reactor.loop.create_task(self._connect_async())
+
+    async def _connect_async(self):
+        server = self.servers.peek()
+        try:
+            await self.connection.connect(server.host, server.port,
+                                          self._nickname, server.password,
+                                          ircname=self._realname)
+        except (OSError, irc.client.ServerConnectionError):
+            self._reconnect()
+
+    def _on_disconnect(self, connection, event):
+        self.channels = IRCDict()
+        self._reconnect()
+
+    def _reconnect(self):
+        self.reactor.loop.call_later(self.reconnect_interval, self._connect)
+
+    def start(self):
+        """Connect and run the event loop."""
+        self._connect()
+        self.reactor.process_forever()
+
+
+class AioExportServer():
+    """Serve export_server's responses for <logbook> from the event loop.
+    Connections are kept alive between requests and closed after
+    idle_timeout seconds without one."""
+    def __init__(self, logbook, modes, address=('', 12000), idle_timeout=300):
+        self.exporter = Exporter(logbook, modes)
+        self.address = address
+        self.idle_timeout = idle_timeout
+        self._server = None
+
+    async def start(self):
+        host, port = self.address
+        self._server = await asyncio.start_server(self._serve, host or None,
+                                                  port)
+
+    async def _serve(self, reader, writer):
+        try:
+            while await self._respond(reader, writer):
+                pass
+        except (ConnectionError, ValueError, asyncio.TimeoutError,
+                asyncio.IncompleteReadError):
+            # Dropped or idle connections, and request lines or headers
+            # longer than the reader's limit.
+            pass
+        finally:
+            writer.close()
+
+    async def _readline(self, reader):
+        return await asyncio.wait_for(reader.readline(), self.idle_timeout)
+
+    async def _respond(self, reader, writer):
+        """Answer one request, returning whether to keep the connection."""
+        line = await self._readline(reader)
+        if not line:
+            return False
+        try:
+            method, path, version = line.decode("latin-1").split()
+        except ValueError:
+            await self._send(writer, self.exporter.error(400), False)
+            return False
+        headers = Message()
+        while True:
+            line = await self._readline(reader)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip()] = value.strip()
+        keep_alive = (version == "HTTP/1.1"
+                      and headers.get("Connection", "").lower() != "close")
+        if method not in ("GET", "HEAD"):
+            response = self.exporter.error(501)
+        else:
+            nick = self.exporter.export_nick(path)
+            sessions = None
+            if nick is not None:
+                # Fetch the log without blocking the loop and hand it to the
+                # exporter, which would otherwise read it again if it has
+                # left the cache since.
+                sessions = await asyncio.get_running_loop().run_in_executor(
+                    None, self.exporter.logbook.history, nick)
+            response = self.exporter.respond(path, headers, sessions)
+        if version != "HTTP/1.1":
+            status, response_headers, body = response
+            response = status, unchunked(response_headers), body
+        await self._send(writer, response, keep_alive, method != "HEAD")
+        return keep_alive
+
+    async def _send(self, writer, response, keep_alive, send_body=True):
+        status, headers, body = response
+        head = ["HTTP/1.1 %d %s" % (status, HTTPStatus(status).phrase),
+                "Date: " + formatdate(usegmt=True)]
+        head.extend(name + ": " + value for name, value in headers)
+        if not keep_alive:
+            head.append("Connection: close")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        if not send_body:
+            await writer.drain()
+            return
+        for data in chunked(headers, body):
+            writer.write(data)
+            await writer.drain()
+        await writer.drain()
+
+
+def run(control_nick, nickname, server, ip_address, port=6667,
+        export_address=('', 12000), **options):
+    """Run an AioPomodoroBot and an AioExportServer on a new event loop.
+    <options> are passed on to PomodoroBot."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    bot = AioPomodoroBot(control_nick, nickname, server, ip_address, port,
+                         **options)
+    httpd = AioExportServer(bot._logbook, Pomodoro._modes, export_address)
+    loop.run_until_complete(httpd.start())
+    bot.start()
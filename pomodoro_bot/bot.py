@@ -0,0 +1,24 @@
+import irc.bot
+from .commands import PomodoroCommands
+
+
+class PomodoroBot(PomodoroCommands, irc.bot.SingleServerIRCBot):
+    """PomodoroCommands connected to an IRC server with irc.bot.
+
+    The bot connects to <server> on <port>, the other arguments are those of
+    PomodoroCommands. The network defaults to the server's name."""
+    def __init__(self, control_nick, nickname, server, ip_address, port=6667,
+                 *arguments, **options):
+        irc.bot.SingleServerIRCBot.__init__(self, [(server, port)], nickname, nickname)
+        options["network"] = options.get("network") or server
+        PomodoroCommands.__init__(self, control_nick, nickname, self.connection,
+                                  ip_address, *arguments, **options)
+
+    def do_quit(self, connection, event):
+        """Quit the bot program at the bot controllers command.
+
+        The logbook is compacted and every queued write is allowed to reach the
+        disk before the bot disconnects. A shared logbook is only committed,
+        its owner compacts it."""
+        self.close()
+        self.die("Goodbye.")
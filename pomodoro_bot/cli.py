@@ -0,0 +1,133 @@
+"""Command line entry point, run with python -m pomodoro_bot.
+
+The IRC and HTTP stacks, and the recorders, are only imported once the
+command line asks for them."""
+import os
+import argparse
+from threading import Thread
+
+
+def main():
+    """Parse the command line, then start the bot and the export server."""
+    parser = argparse.ArgumentParser(prog="python -m pomodoro_bot")
+    parser.add_argument("controller_nick", nargs="?",
+                        help="The nickname of the user that controls the bot.")
+    parser.add_argument("bot_nick", nargs="?",
+                        help="The nickname of the bot.")
+    parser.add_argument("server_address", nargs="?",
+                        help="The address of the server to connect to.")
+    parser.add_argument("ip_address", nargs="?",
+                        help="The IP address of the server running the bot.")
+    parser.add_argument("-p", "--port", type=int, default=6667)
+    parser.add_argument("--log",
+                        help="Write out an input recording to the given filepath.")
+    parser.add_argument("--log-format", choices=["text", "binary"],
+                        default="text",
+                        help="Record as tab separated text, or as buffered binary"
+                        + " segments with a seek index named <filepath>.<n>.rec.")
+    parser.add_argument("--replay",
+                        help="Simulate the bot on the given input recording"
+                        + " instead of connecting, ignoring the other arguments.")
+    parser.add_argument("--asyncio", action="store_true",
+                        help="Run the bot and the export server on one asyncio"
+                        + " event loop instead of threads, see aio.py.")
+    parser.add_argument("--networks",
+                        help="Serve every network in the given JSON file from"
+                        + " this process, see runtime.py, ignoring the other"
+                        + " arguments.")
+    parser.add_argument("--commit-interval", type=int, default=10,
+                        help="Seconds between group commits of logged sessions.")
+    parser.add_argument("--batch-size", type=int, default=64,
+                        help="Pending sessions that force an early group commit.")
+    parser.add_argument("--compact-interval", type=int, default=3600,
+                        help="Seconds between compactions of the logbook journals.")
+    parser.add_argument("--cache-size", type=int, default=1024,
+                        help="Number of user logbooks to keep loaded in memory.")
+    parser.add_argument("--snapshot", default=".snapshot.json",
+                        help="File in the work logs directory the channels'"
+                        + " state is saved to and restored from on startup.")
+    parser.add_argument("--snapshot-interval", type=int, default=30,
+                        help="Seconds between snapshots of the channels' state.")
+    parser.add_argument("--dormant-after", type=int, default=3600,
+                        help="Seconds without a session or command after which"
+                        + " a channel's state is dropped until it is used again.")
+    parser.add_argument("--io-workers", type=int, default=4,
+                        help="Threads writing the logbook and input recording,"
+                        + " 0 writes them on the IRC thread.")
+    parser.add_argument("--io-queue-size", type=int, default=1024,
+                        help="Writes each I/O thread may have queued before"
+                        + " the bot waits for the disk.")
+    arguments = parser.parse_args()
+    if arguments.replay:
+        from . import replay
+        replay.main([arguments.replay])
+        return
+    if arguments.networks:
+        from . import runtime
+        runtime.main([arguments.networks])
+        return
+    if not arguments.ip_address:
+        parser.error("the following arguments are required: controller_nick,"
+                     + " bot_nick, server_address, ip_address")
+    if arguments.log:
+        from . import recording
+    if arguments.log and arguments.log_format == "binary":
+        log = recording.BinaryRecorder(os.path.abspath(arguments.log))
+    elif arguments.log:
+        log = recording.TextRecorder(os.path.abspath(arguments.log))
+    else:
+        log = False
+
+    try:
+        os.chdir("work_logs/")
+    except FileNotFoundError:
+        os.mkdir("work_logs/")
+        os.chdir("work_logs/")
+
+    if arguments.asyncio:
+        from . import aio
+        aio.run(arguments.controller_nick,
+                arguments.bot_nick,
+                arguments.server_address,
+                arguments.ip_address,
+                arguments.port,
+                log=log,
+                commit_interval=arguments.commit_interval,
+                batch_size=arguments.batch_size,
+                compact_interval=arguments.compact_interval,
+                cache_size=arguments.cache_size,
+                io_workers=arguments.io_workers,
+                io_queue_size=arguments.io_queue_size,
+                snapshot=arguments.snapshot,
+                snapshot_interval=arguments.snapshot_interval,
+                dormant_after=arguments.dormant_after)
+        return
+
+    from . import export_server
+    from .bot import PomodoroBot
+    from .core import Pomodoro
+
+    bot = PomodoroBot(arguments.controller_nick,
+                      arguments.bot_nick,
+                      arguments.server_address,
+                      arguments.ip_address,
+                      arguments.port,
+                      log,
+                      arguments.commit_interval,
+                      arguments.batch_size,
+                      arguments.compact_interval,
+                      arguments.cache_size,
+                      io_workers=arguments.io_workers,
+                      io_queue_size=arguments.io_queue_size,
+                      snapshot=arguments.snapshot,
+                      snapshot_interval=arguments.snapshot_interval,
+                      dormant_after=arguments.dormant_after)
+
+    bot_thread = Thread(target=bot.start,
+                        daemon=False)
+    bot_thread.start()
+
+    httpd = export_server.ExportServer(bot._logbook, Pomodoro._modes)
+    httpd_thread = Thread(target=httpd.serve_forever,
+                          daemon=False)
+    httpd_thread.start()
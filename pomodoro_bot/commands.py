@@ -0,0 +1,625 @@
+"""The pomodoro bot's commands, independent of the IRC library.
+
+PomodoroCommands holds the channel table, the command dispatch and every
+command handler. It talks to the network only through the connection it is
+given, so bot.PomodoroBot can drive it from irc.bot and the replay from a stub
+connection, without the latter paying for importing irc."""
+import time
+import json
+from functools import partial
+from . import metrics
+from . import workers
+from .core import BULK
+from .core import GoalIndex
+from .core import PhaseScheduler
+from .core import MessageQueue
+from .core import Pomodoro
+from .core import SessionStats
+from .core import WorkLogbook
+from .core import is_channel
+from .core import replace_file
+
+
+PUBMSG_SECONDS = metrics.REGISTRY.histogram(
+    "pomodoro_pubmsg_seconds",
+    "Time spent in on_pubmsg per channel message, chatter included.")
+COMMANDS = metrics.REGISTRY.counter(
+    "pomodoro_commands", "Public commands dispatched.", ("command",))
+
+
+class PomodoroCommands():
+    """The pomodoro bot sits in a channel and waits for someone to start a pomodoro.
+    Once a user expresses interest a five minute wait period for other users to
+    register begins. After that the bot loops through a work/break period according
+    to a specific time split of minutes worked to minutes spent on break. There
+    are three modes: Long, Lazy, and Fast. Long is a 50:10 split, Lazy is a 45:15
+    split, and Fast is a 25:5 split. At each break users are expected to register
+    themselves as working in the next pomodoro, if nobody registers the loop is
+    broken and the bot goes back to its initial state. 
+
+    The bot also keeps a table of all the users which are doing the current 
+    pomodoro and what they're working on.
+
+    Given a <snapshot> path the state of every channel is saved there every
+    snapshot_interval seconds and restored when the bot starts, so a restart
+    rejoins the channels and resumes their sessions on time.
+
+    A channel without a session that hasn't used the bot for dormant_after
+    seconds is left in _channel_table as None, and given a fresh pomodoro
+    again the next time someone in it uses a command.
+
+    Everything the bot sends goes through <connection>, which only needs
+    get_nickname, join, part, notice and execute_every."""
+    _pub_aliases = {"pomo": "pomodoro", "reg": "register", "who": "registered"}
+    # Limits on .search replies: results listed, characters of the query
+    # echoed, and bytes of the reply, which must fit in one notice.
+    search_results = 10
+    query_limit = 60
+    reply_limit = 300
+
+    def __init__(self, control_nick, nickname, connection, ip_address, log=False,
+                 commit_interval=10, batch_size=64, compact_interval=3600,
+                 cache_size=1024, work_logs=".", clock=time.time, io_workers=4,
+                 io_queue_size=1024, logbook=None, channels=(), network=None,
+                 snapshot=None, snapshot_interval=30, snapshot_max_age=3600,
+                 dormant_after=3600):
+        self.connection = connection
+        self._nickname = nickname
+        self._controller = control_nick
+        self._channel_table = {}
+        self._ip_address = ip_address
+        self._network = network or ""
+        self._channels = channels
+        self._io = workers.WorkerPool(io_workers, io_queue_size)
+        # A logbook passed in is shared with other bots, whoever created it
+        # commits and compacts it.
+        self._owns_logbook = logbook is None
+        if logbook is None:
+            logbook = WorkLogbook(work_logs,
+                                  batch_size=batch_size,
+                                  commit_interval=commit_interval,
+                                  cache_size=cache_size,
+                                  clock=clock,
+                                  pool=self._io)
+        self._logbook = logbook
+        self._log = log
+        self._commit_interval = commit_interval
+        self._compact_interval = compact_interval
+        self._scheduler = PhaseScheduler(clock=clock)
+        self._outbox = MessageQueue(self.connection, clock=clock)
+        self._maintenance_scheduled = False
+        self._snapshot_path = snapshot
+        self._snapshot_interval = snapshot_interval
+        self._snapshot_max_age = snapshot_max_age
+        self._dormant_after = dormant_after
+        if snapshot:
+            self.restore_snapshot()
+        self._profiler = metrics.Profiler()
+        labels = ("network", "nickname", "statistic")
+        self._collectors = [
+            ("pomodoro_channel_users",
+             "Users registered for the current pomodoro, by channel and phase.",
+             ("network", "channel", "phase"), self._channel_samples, "gauge"),
+            ("pomodoro_outbox", "Outbound message queue depth and latency.",
+             labels, partial(self._outbox_samples, False), "gauge"),
+            ("pomodoro_outbox_messages",
+             "Notices and lines sent or dropped by the outbound queue.",
+             labels, partial(self._outbox_samples, True), "counter"),
+            ("pomodoro_io_pool", "Disk I/O worker pool queue length.",
+             labels, partial(self._io_samples, False), "gauge"),
+            ("pomodoro_io_pool_tasks", "Disk I/O worker pool task counters.",
+             labels, partial(self._io_samples, True), "counter")]
+        if self._owns_logbook:
+            self._collectors += [
+                ("pomodoro_logbook_cache", "Logbook histories cached.",
+                 ("statistic",), partial(self._cache_samples, False), "gauge"),
+                ("pomodoro_logbook_cache_events",
+                 "Logbook history cache hits, misses and evictions.",
+                 ("statistic",), partial(self._cache_samples, True), "counter")]
+        for collector in self._collectors:
+            metrics.REGISTRY.collector(*collector)
+
+    def _channel_samples(self):
+        for channel, session in list(self._channel_table.items()):
+            if session is None:
+                yield (self._network, channel, "dormant"), 0
+                continue
+            yield ((self._network, channel, session.session_running() or "idle"),
+                   len(session.users()))
+
+    def _outbox_samples(self, counted):
+        return metrics.stat_samples(self._outbox.stats(),
+                                    (self._network, self._nickname),
+                                    MessageQueue.counters, counted)
+
+    def _cache_samples(self, counted):
+        return metrics.stat_samples(self._logbook.cache_stats(), (),
+                                    WorkLogbook.cache_counters, counted)
+
+    def _io_samples(self, counted):
+        return metrics.stat_samples(self._io.stats(),
+                                    (self._network, self._nickname),
+                                    workers.WorkerPool.counters, counted)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._build_dispatch()
+
+    @classmethod
+    def _build_dispatch(cls):
+        """Build the command dispatch tables from the do_ and do_pub_ methods.
+
+        _pub_commands maps public command names and their aliases to handlers,
+        _private_commands does the same for the controller's commands and
+        _command_initials holds every character a public command line can
+        start with, so on_pubmsg can reject chatter from the first character."""
+        cls._pub_commands = {}
+        cls._private_commands = {}
+        for name in dir(cls):
+            if name.startswith("do_pub_"):
+                cls._pub_commands[name[len("do_pub_"):]] = getattr(cls, name)
+            elif name.startswith("do_"):
+                cls._private_commands[name[len("do_"):]] = getattr(cls, name)
+        for alias in cls._pub_aliases:
+            cls._pub_commands[alias] = cls._pub_commands[cls._pub_aliases[alias]]
+        cls._command_initials = frozenset(
+            ". \t" + "".join(name[0] for name in cls._pub_commands))
+
+    def on_welcome(self, connection, event):
+        """Join the channels the bot was started with and rejoin those it
+        already has pomodoros for, then start the phase scheduler, the
+        logbook's periodic commit and compaction passes, the channel
+        snapshots and the dormant channel sweep once the bot is connected."""
+        for channel in self._channel_table:
+            connection.join(channel)
+        for channel in self._channels:
+            if channel.lower() not in self._channel_table:
+                self.join_channel(connection, channel)
+        if self._maintenance_scheduled:
+            return
+        self.execute_every(self._scheduler.tick, self._scheduler.run_due)
+        self.execute_every(self._outbox.interval, self._outbox.pump)
+        if self._owns_logbook:
+            self.execute_every(self._commit_interval, self._logbook.commit)
+            self.execute_every(self._compact_interval, self._logbook.compact)
+        if self._log:
+            self.execute_every(self._commit_interval, self._flush_log)
+        if self._snapshot_path:
+            self.execute_every(self._snapshot_interval, self.save_snapshot)
+        if self._dormant_after:
+            self.execute_every(self._dormant_after, self.evict_dormant)
+        self._maintenance_scheduled = True
+
+    def execute_every(self, period, function):
+        """Call function() every <period> seconds on the bot's reactor."""
+        self.connection.execute_every(period, function)
+
+    def _session(self, channel):
+        """Return the pomodoro of <channel>, giving a dormant channel a fresh
+        one, and mark the channel active."""
+        session = self._channel_table[channel]
+        if session is None:
+            session = Pomodoro(self._outbox, channel, self._scheduler)
+            self._channel_table[channel] = session
+        else:
+            session.active = self._scheduler.now()
+        return session
+
+    def evict_dormant(self):
+        """Drop the pomodoros of channels which have had no session and no
+        commands for dormant_after seconds, returning how many were
+        dropped."""
+        horizon = self._scheduler.now() - self._dormant_after
+        dormant = [channel for channel, session in self._channel_table.items()
+                   if session is not None and not session.session_running()
+                   and session.active <= horizon]
+        for channel in dormant:
+            self._channel_table[channel] = None
+        return len(dormant)
+
+    def snapshot(self):
+        """Return the state of every channel's pomodoro, see
+        Pomodoro.snapshot. Dormant channels are saved as None."""
+        return {"saved": self._scheduler.now(),
+                "channels": {channel: session and session.snapshot()
+                             for channel, session
+                             in self._channel_table.items()}}
+
+    def save_snapshot(self):
+        """Queue the channel snapshot for writing to the snapshot file."""
+        self._io.submit(".snapshot", replace_file, self._snapshot_path,
+                        json.dumps(self.snapshot(), separators=(",", ":")))
+
+    def restore_snapshot(self):
+        """Restore the channels saved in the snapshot file, returning how
+        many there were. Their sessions resume where they left off unless the
+        snapshot is older than snapshot_max_age seconds, then the channels
+        are only rejoined and left dormant."""
+        try:
+            infile = open(self._snapshot_path)
+            state = json.load(infile)
+            infile.close()
+        except FileNotFoundError:
+            return 0
+        resume = (self._scheduler.now() - state["saved"]
+                  <= self._snapshot_max_age)
+        for channel, saved in state["channels"].items():
+            if resume and saved is not None:
+                self._channel_table[channel] = Pomodoro.restore(
+                    self._outbox, channel, self._scheduler, saved)
+            else:
+                self._channel_table[channel] = None
+        return len(state["channels"])
+
+    def _record(self, type, event):
+        """Queue <event> for the input recording, stamped with the time it
+        arrived."""
+        self._io.submit(".recording", self._log.record, type, event.source.nick,
+                        event.arguments[0], event.target, time.time())
+
+    def _flush_log(self):
+        self._io.submit(".recording", self._log.flush)
+
+    def on_privmsg(self, connection, event):
+        """Allow the bot controller to message PomodoroBot."""
+        if self._log:
+            self._record("privmsg", event)
+        if event.source.nick != self._controller:
+            print("You cannot send private commands to",
+                  connection.get_nickname() + ".")
+            return False
+        arguments = event.arguments[0].split(None, 1)
+        try:
+            command = self._private_commands.get(arguments[0])
+        except IndexError:
+            return False
+        if command:
+            command(self, connection, event)
+
+    def do_join(self, connection, event):
+        """Join a channel specified by the bot controller."""
+        arguments = event.arguments[0].split()
+        try:
+            if is_channel(arguments[1]):
+                self.join_channel(connection, arguments[1])
+            else:
+                self._outbox.notice(event.source.nick,
+                                    "'" + arguments[1] + "' is not a channel.")
+        except IndexError:
+            usage_msg = "Usage: join <channel> Example: join #test"
+            self._outbox.notice(event.source.nick, usage_msg)
+
+    def join_channel(self, connection, channel):
+        """Join <channel>, which gets a pomodoro once someone uses the bot
+        there."""
+        connection.join(channel)
+        self._channel_table[channel.lower()] = None
+
+    def do_part(self, connection, event):
+        """Part a channel specified by the bot controller, cancelling its
+        pomodoro."""
+        arguments = event.arguments[0].split()
+        try:
+            connection.part(arguments[1])
+            session = self._channel_table.pop(arguments[1].lower(), None)
+            if session is not None:
+                session.pomodoro_cancel()
+        except IndexError:
+            usage_msg = "Usage: part <channel> Example: part #test"
+            self._outbox.notice(event.source.nick, usage_msg)
+
+    def do_cache(self, connection, event):
+        """Report the logbook history cache counters to the bot controller."""
+        stats = self._logbook.cache_stats()
+        self._outbox.notice(event.source.nick,
+                            " ".join(key + "=" + str(stats[key]) for key in stats))
+
+    def do_outbox(self, connection, event):
+        """Report the outbound message queue statistics to the bot controller."""
+        stats = self._outbox.stats()
+        self._outbox.notice(event.source.nick,
+                            " ".join(key + "=" + str(stats[key]) for key in stats))
+
+    def do_io(self, connection, event):
+        """Report the disk I/O worker pool counters to the bot controller."""
+        stats = self._io.stats()
+        self._outbox.notice(event.source.nick,
+                            " ".join(key + "=" + str(stats[key]) for key in stats))
+
+    def do_profile(self, connection, event):
+        """Profile the bot at the bot controller's command.
+
+        Usage: profile start [cprofile, sampling], profile stop"""
+        arguments = event.arguments[0].split()
+        if arguments[1:2] == ["start"]:
+            mode = arguments[2] if len(arguments) > 2 else "cprofile"
+            if self._profiler.start(mode):
+                message = "Started the " + self._profiler.mode + " profiler."
+            else:
+                message = "The " + self._profiler.mode + " profiler is running."
+            self._outbox.notice(event.source.nick, message)
+        elif arguments[1:2] == ["stop"]:
+            for line in self._profiler.stop() or ["No profiler is running."]:
+                self._outbox.notice(event.source.nick, line, BULK)
+        else:
+            self._outbox.notice(event.source.nick,
+                                "Usage: profile start [cprofile, sampling],"
+                                + " profile stop")
+
+    def do_quit(self, connection, event):
+        """Quit the bot program at the bot controllers command."""
+        self.close()
+
+    def close(self):
+        """Compact the logbook and let every queued write reach the disk. A
+        shared logbook is only committed, its owner compacts it. The bot's
+        metrics collectors are removed."""
+        for name, help, labels, function, kind in self._collectors:
+            metrics.REGISTRY.remove_collector(name, function)
+        self._collectors = []
+        if self._owns_logbook:
+            self._logbook.compact()
+        else:
+            self._logbook.commit()
+        if self._log:
+            self._io.submit(".recording", self._log.close)
+        if self._snapshot_path:
+            self.save_snapshot()
+        self._io.close()
+
+    def on_pubmsg(self, connection, event):
+        """Parse messages sent into a channel PomodoroBot is in for commands.
+        If a command is found execute it."""
+        start = time.perf_counter()
+        try:
+            return self._dispatch_pubmsg(connection, event)
+        finally:
+            PUBMSG_SECONDS.observe(time.perf_counter() - start)
+
+    def _dispatch_pubmsg(self, connection, event):
+        if self._log:
+            self._record("pubmsg", event)
+        message = event.arguments[0]
+        # Most channel traffic is chatter, reject it before splitting the line.
+        if not message:
+            return False
+        nickname = connection.get_nickname()
+        if (message[0] not in self._command_initials
+            and not message.startswith(nickname)):
+            return False
+        arguments = message.split(None, 2)
+        if not arguments:
+            return False
+        command = self._pub_commands.get(arguments[0].strip("."))
+        # "PomodoroBot: help" addresses the bot, the bare nick is chatter.
+        if (not command and len(arguments) > 1
+            and arguments[0].strip(":") == nickname):
+            command = self._pub_commands.get(arguments[1].strip("."))
+            if command:
+                # Handlers parse the line from the command on.
+                event.arguments[0] = message.split(None, 1)[1]
+        if not command:
+            return False
+        COMMANDS.labels(command.__name__[len("do_pub_"):]).inc()
+        command(self, connection, event)
+
+    def do_pub_pomodoro(self, connection, event):
+        """Start a pomodoro if one isn't already running, if one is call for a 
+        vote to change modes.
+
+        Usage: .pomodoro <mode>, where mode is one of [fast, long, lazy].
+        Example: .pomodoro fast"""
+        arguments = event.arguments[0].split()
+        try:
+            mode = arguments[1].lower()
+        except IndexError:
+            self._outbox.notice(event.source.nick,
+                                "Usage: pomodoro <mode>, where mode is one of"
+                                + " [fast, long, lazy]." + " Example: .pomodoro fast")
+            return False
+        if mode not in Pomodoro._modes:
+            self._outbox.notice(event.source.nick,
+                                "'" + mode + "' is not a mode, use one of"
+                                + " [fast, long, lazy]." + " Example: .pomodoro fast")
+            return False
+        session = self._session(event.target)
+        if session.session_running() == "break" and not session.votes:
+            self._outbox.notice(event.target,
+                                event.source.nick + " has requested to change the" +
+                                " current setting from " +
+                                session.mode + "to " +
+                                mode + ".")
+            self._outbox.notice(event.target,
+                                "If you would like to back this change type "
+                                + "'pomodoro " + mode + "' otherwise stay"
+                                + " silent or type pomodoro <mode> to vote for a"
+                                + " different one.")
+            self._outbox.notice(event.target,
+                                "(Keep in mind you must be registered for the current"
+                                + " pomodoro to vote against it.)")
+        elif session.session_running() == "break":
+            votes = session.vote(mode, event.source.nick)
+            self._outbox.notice(event.source.nick,
+                                "Your vote has been cast.")
+            # Only the mode just voted for can have reached a quorum.
+            if votes >= len(session.users()):
+                session.pomodoro_cancel()
+                session = Pomodoro(self._outbox, event.target, self._scheduler)
+                self._channel_table[event.target] = session
+                session.initialize_pomodoro(mode, delay=0)
+        elif session.session_running() == "work":
+            self._outbox.notice(event.source.nick,
+                                "You can't vote to change modes while a work"
+                                + " session is running.")
+            return False
+        else:
+            session.initialize_pomodoro(mode)
+            split = Pomodoro._modes[mode]
+            self._outbox.notice(event.target,
+                                      event.source.nick + " has started a new "
+                                       + mode + " (" + str(split[0]) + ":"
+                                       + str(split[1]) + ") " 
+                                       + "pomodoro session, if you would like to join in type "
+                                       + "'.register <the thing you are working on>'. Example:"
+                                       + " .register Programming a Pomodoro IRC Bot.")
+            self._outbox.notice(event.target,
+                                "The session will start in five minutes.")
+
+    def do_pub_register(self, connection, event):
+        """Register to work in the next pomodoro session.
+
+        Usage: .register <thing you're working on>
+        Example: .register I'm writing a pomodoro bot."""
+        arguments = event.arguments[0].split()
+        goal = ""
+        for word in arguments[1:]:
+            goal = goal + " " + word
+        session = self._session(event.target)
+        if session.session_running():
+            try:
+                session.register_nick(event.source.nick, goal)
+            except IndexError:
+                session.register_nick(event.source.nick, None)
+            self._logbook.log_session(event.source.nick,
+                                      session.mode,
+                                      goal,
+                                      event.target)
+            self._outbox.notice(event.source.nick,
+                                "You have registered for the next session.")
+        else:
+            self._outbox.notice(event.source.nick,
+                                "There is no session running. You can start a new "
+                                + "one with the 'pomodoro' command. Example: " +
+                                "pomodoro fast.")
+
+    def do_pub_registered(self, connection, event):
+        """Send a list of registered users and what they're working on to the
+        nick requesting the list.
+
+        Usage: .registered
+        Example: .registered"""
+        users = self._session(event.target).users()
+        if users:
+            for user in users:
+                self._outbox.notice(event.source.nick,
+                                    str(user) + " | " + str(users[user]),
+                                    BULK)
+        else:
+            self._outbox.notice(event.source.nick,
+                                "There are currently no registered users.")
+
+    def do_pub_export(self, connection, event):
+        """Export a log of your work sessions to a JSON format. The log is also
+        available as .jsonl, .csv and .ics, and can be limited to a time span
+        with ?since=2016-04-01&until=2016-04-30.
+
+        Usage: .export
+        Example: .export"""
+        self._outbox.notice(event.source.nick,
+                            self._ip_address + ":12000/" + event.source.nick +
+                            ".json")
+
+    def do_pub_stats(self, connection, event):
+        """Send statistics about the sessions of a nick or channel, by default
+        your own, over all time, today or this week.
+
+        Usage: .stats [nick or channel] [all, today, week]
+        Example: .stats #pomodoro week"""
+        arguments = event.arguments[0].split()[1:]
+        period = "all"
+        if arguments and arguments[-1].lower() in SessionStats.periods:
+            period = arguments.pop().lower()
+        name = arguments[0] if arguments else event.source.nick
+        summary = self._logbook.summary(name, period, self._scheduler.now())
+        if summary is None:
+            self._outbox.notice(event.source.nick,
+                                "No sessions have been logged for " + name + ".")
+            return
+        if period == "all":
+            modes = ", ".join(mode + " " + str(count) for mode, count
+                              in sorted(summary["by_mode"].items()))
+            message = (name + ": " + str(summary["sessions"]) + " sessions ("
+                       + modes + "), " + str(summary["minutes"])
+                       + " focused minutes, " + str(summary["streak"])
+                       + " day streak (longest " + str(summary["longest_streak"])
+                       + ").")
+        else:
+            message = (name + (" today: " if period == "today" else " this week: ")
+                       + str(summary["sessions"]) + " sessions, "
+                       + str(summary["minutes"]) + " focused minutes.")
+        self._outbox.notice(event.source.nick, message)
+
+    def do_pub_search(self, connection, event):
+        """Find out who has been working on something, ranked by how well
+        their registered goals match.
+
+        Usage: .search <words>
+        Example: .search thesis"""
+        terms = event.arguments[0].split(None, 1)[1:]
+        if not terms:
+            self._outbox.notice(event.source.nick,
+                                "Usage: .search <words> Example: .search thesis")
+            return
+        results = self._logbook.search(terms[0], limit=self.search_results)
+        if not results:
+            self._outbox.notice(event.source.nick,
+                                "Nobody has registered a goal matching '"
+                                + self._clip(" ".join(sorted(
+                                    GoalIndex.words(terms[0])))) + "'.")
+            return
+        # Only the words which matched are echoed, and only as many results
+        # as fit in one notice are listed.
+        matched = sorted(set(word for result in results
+                             for word in result["words"]))
+        message = "Matches for '" + self._clip(" ".join(matched)) + "':"
+        separator = " "
+        for result in results:
+            entry = (separator + result["nick"] + " ("
+                     + str(len(result["sessions"])) + " sessions)")
+            if len((message + entry).encode()) > self.reply_limit:
+                break
+            message = message + entry
+            separator = ", "
+        self._outbox.notice(event.source.nick, message, BULK)
+
+    def _clip(self, text):
+        """Return <text> cut down to query_limit characters."""
+        if len(text) <= self.query_limit:
+            return text
+        return text[:self.query_limit - 3] + "..."
+
+    def do_pub_help(self, connection, event):
+        """Send a help message to the user who requested it.
+
+        Usage: .help, .help <command>
+        Example: .help help"""
+        arguments = event.arguments[0].split()
+        help_msg = ["The PomodoroBot has the following commands:",
+                    "pomodoro register registered export stats search help",
+                    " ",
+                    "To get more information about a command, type:",
+                    " .help <command name>",
+                    "Example:",
+                    " .help help"]
+        try:
+            if arguments[1] in self._pub_commands:
+                from inspect import getdoc
+                doc = getdoc(self._pub_commands[arguments[1]])
+                if doc:
+                    serialized_doc = doc.split("\n")
+                else:
+                    serialized_doc = ""
+                for line in serialized_doc:
+                    self._outbox.notice(event.source.nick,
+                                        line, BULK)
+            else:
+                for line in help_msg:
+                    self._outbox.notice(event.source.nick,
+                                        line, BULK)
+        except IndexError:
+            for line in help_msg:
+                self._outbox.notice(event.source.nick,
+                                    line, BULK)
+
+
+PomodoroCommands._build_dispatch()
@@ -0,0 +1,1350 @@
+"""The bot's core: phase scheduling, pacing of outbound messages, the state of
+a channel's pomodoro and the WorkLogbook of work sessions.
+
+Nothing in here needs the IRC library or the HTTP server, so tools that only
+work with sessions and logbooks can import it without paying for them."""
+from collections import namedtuple
+from collections import OrderedDict
+from collections import deque
+from array import array
+from threading import RLock
+import os
+import sys
+import time
+import heapq
+import math
+import re
+import bisect
+import json
+from . import metrics
+from . import workers
+
+
+TIMER_LATENESS = metrics.REGISTRY.histogram(
+    "pomodoro_timer_lateness_seconds",
+    "How long after its deadline each phase transition ran.",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 1.5, 2, 5, 10, 30, 60))
+TIMER_ERRORS = metrics.REGISTRY.counter(
+    "pomodoro_timer_errors", "Phase transitions which raised an exception.")
+NOTICE_ERRORS = metrics.REGISTRY.counter(
+    "pomodoro_notice_errors", "Notices dropped because sending them raised.")
+LOGBOOK_SECONDS = metrics.REGISTRY.histogram(
+    "pomodoro_logbook_seconds",
+    "Duration of WorkLogbook disk operations.", ("operation",))
+
+
+def is_channel(name):
+    """Return whether <name> is a channel name, like irc.client.is_channel
+    without importing the IRC library."""
+    return bool(name) and name[0] in "#&+!"
+
+
+class PhaseTimer():
+    """A phase transition waiting in the PhaseScheduler."""
+    __slots__ = ("deadline", "function", "arguments", "cancelled", "popped")
+
+    def __init__(self, deadline, function, arguments):
+        self.deadline = deadline
+        self.function = function
+        self.arguments = arguments
+        self.cancelled = False
+        self.popped = False
+
+    def __lt__(self, other):
+        return self.deadline < other.deadline
+
+
+class PhaseScheduler():
+    """Single scheduler which owns the phase transitions of every channel.
+
+    Timers are kept in a heap ordered by their absolute deadline. The bot
+    calls run_due() every <tick> seconds from one execute_every timer, which
+    runs every transition that has come due since the last tick in a single
+    pass. Cancelled timers are skipped when they reach the top of the heap."""
+    def __init__(self, tick=1, clock=time.time):
+        self.tick = tick
+        self._clock = clock
+        self._heap = []
+        self._cancelled = 0
+
+    def now(self):
+        """Return the current time of the scheduler's clock."""
+        return self._clock()
+
+    def schedule_at(self, deadline, function, arguments=()):
+        """Call function(*arguments) at the absolute time <deadline>."""
+        timer = PhaseTimer(deadline, function, arguments)
+        heapq.heappush(self._heap, timer)
+        return timer
+
+    def schedule(self, delay, function, arguments=()):
+        """Call function(*arguments) <delay> seconds from now."""
+        return self.schedule_at(self.now() + delay, function, arguments)
+
+    def cancel(self, timer):
+        """Cancel <timer> if it hasn't fired yet."""
+        if not timer.cancelled and not timer.popped:
+            self._cancelled += 1
+        timer.cancelled = True
+
+    def next_deadline(self):
+        """Return the deadline of the earliest live timer, or None."""
+        while self._heap and self._heap[0].cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
+        return self._heap[0].deadline if self._heap else None
+
+    def run_due(self):
+        """Run every timer whose deadline has passed, returning how many ran.
+
+        A transition which raises is reported and counted, and the rest of
+        the batch still runs."""
+        now = self.now()
+        due = []
+        while self._heap and self._heap[0].deadline <= now:
+            timer = heapq.heappop(self._heap)
+            if timer.cancelled:
+                self._cancelled -= 1
+            else:
+                timer.popped = True
+                due.append(timer)
+        for timer in due:
+            # An earlier transition in this batch may have cancelled it.
+            if not timer.cancelled:
+                TIMER_LATENESS.observe(now - timer.deadline)
+                try:
+                    timer.function(*timer.arguments)
+                except Exception:
+                    TIMER_ERRORS.inc()
+                    print("Phase transition",
+                          getattr(timer.function, "__name__", timer.function),
+                          "failed:", file=sys.stderr)
+                    import traceback
+                    traceback.print_exc()
+        return len(due)
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled
+
+
+URGENT, NORMAL, BULK = 0, 1, 2
+
+
+class TokenBucket():
+    """Token bucket allowing <rate> sends per second with bursts of up to
+    <capacity> sends."""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def ready(self, now):
+        """Refill the bucket and return whether a token is available."""
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+    def full(self, now):
+        """Return whether the bucket has refilled to capacity by <now>."""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class MessageQueue():
+    """Outbound notice queue layered over the IRC connection.
+
+    Notices are queued by priority: URGENT for phase announcements, NORMAL for
+    command replies and BULK for long replies such as help and user lists.
+    pump() is called every <interval> seconds and sends what the global and
+    per target token buckets allow, highest priority first. Lines waiting for
+    the same target at the same priority are packed into one notice, joined by
+    " // ", as long as the notice stays within the 512 byte protocol limit. A
+    single line over the limit is split across several notices, and a notice
+    the connection refuses to send is counted and dropped.
+
+    Every prune_interval seconds the per target buckets which have refilled
+    are dropped. A new bucket starts full, so this only forgets targets
+    which have gone quiet."""
+    max_line = 512
+    prune_interval = 60
+    # The statistics which only ever grow, see metrics.stat_samples.
+    counters = ("sent", "lines", "dropped")
+    # Room for the ":nick!user@host " prefix the server adds when relaying.
+    prefix_reserve = 100
+    separator = " // "
+
+    def __init__(self, connection, interval=0.2, rate=0.5, burst=5,
+                 target_rate=0.25, target_burst=3, clock=time.time):
+        self.interval = interval
+        self._connection = connection
+        self._clock = clock
+        self._queues = [OrderedDict() for priority in (URGENT, NORMAL, BULK)]
+        self._global = TokenBucket(rate, burst, clock())
+        self._target_rate = target_rate
+        self._target_burst = target_burst
+        self._buckets = {}
+        self._pruned = clock()
+        self._depth = 0
+        self._sent = 0
+        self._lines = 0
+        self._dropped = 0
+        self._latency_total = 0
+        self._latency_max = 0
+
+    def notice(self, target, text, priority=NORMAL):
+        """Queue a notice of <text> to <target>."""
+        queue = self._queues[priority]
+        if target in queue:
+            queue[target].append((text, self._clock()))
+        else:
+            queue[target] = deque(((text, self._clock()),))
+        self._depth += 1
+
+    def pump(self):
+        """Send as many queued notices as the rate limits currently allow."""
+        now = self._clock()
+        if now - self._pruned >= self.prune_interval:
+            self._prune(now)
+        for queue in self._queues:
+            for target in list(queue):
+                if not self._global.ready(now):
+                    return
+                bucket = self._bucket(target.lower(), now)
+                if not bucket.ready(now):
+                    continue
+                self._global.take()
+                bucket.take()
+                lines = queue[target]
+                text = self._pack(target, lines, now)
+                if lines:
+                    queue.move_to_end(target)
+                else:
+                    del queue[target]
+                try:
+                    self._connection.notice(target, text)
+                except Exception:
+                    NOTICE_ERRORS.inc()
+                    self._dropped += 1
+                    print("Notice to", target, "failed:", file=sys.stderr)
+                    import traceback
+                    traceback.print_exc()
+                    continue
+                self._sent += 1
+
+    def _bucket(self, target, now):
+        """Return the token bucket pacing notices to <target>."""
+        if target not in self._buckets:
+            self._buckets[target] = TokenBucket(self._target_rate,
+                                                self._target_burst, now)
+        return self._buckets[target]
+
+    def _prune(self, now):
+        """Drop the per target buckets which are full again."""
+        for target in [target for target, bucket in self._buckets.items()
+                       if bucket.full(now)]:
+            del self._buckets[target]
+        self._pruned = now
+
+    def _pack(self, target, lines, now):
+        """Pop the first of <lines> and as many of the following lines as fit
+        into a single notice to <target>, returning the notice text. Blank
+        lines are only spacing between lines and are dropped while packing."""
+        budget = (self.max_line - self.prefix_reserve
+                  - len(("NOTICE " + target + " :\r\n").encode()))
+        text, enqueued = lines.popleft()
+        self._record(now - enqueued)
+        while lines and not text.strip():
+            text, enqueued = lines.popleft()
+            self._record(now - enqueued)
+        size = len(text.encode())
+        if size > budget:
+            text, rest = self._split(text, budget)
+            if rest:
+                # The rest goes out first in the next notice to the target.
+                lines.appendleft((rest, enqueued))
+                self._depth += 1
+            return text
+        while lines:
+            following, enqueued = lines[0]
+            if not following.strip():
+                lines.popleft()
+                self._record(now - enqueued)
+                continue
+            added = len((self.separator + following).encode())
+            if size + added > budget:
+                break
+            lines.popleft()
+            self._record(now - enqueued)
+            text = text + self.separator + following
+            size += added
+        return text
+
+    def _split(self, text, budget):
+        """Split <text> into a head of at most <budget> bytes, broken after
+        the last space in it if there is one, and the rest."""
+        head = text.encode()[:budget].decode(errors="ignore")
+        space = head.rfind(" ")
+        if space > 0:
+            head = head[:space]
+        return head, text[len(head):].lstrip()
+
+    def _record(self, latency):
+        self._depth -= 1
+        self._lines += 1
+        self._latency_total += latency
+        self._latency_max = max(self._latency_max, latency)
+
+    def stats(self):
+        """Return the queue depth and send latency statistics."""
+        return {"queued": self._depth,
+                "urgent": sum(len(lines) for lines in self._queues[URGENT].values()),
+                "bulk": sum(len(lines) for lines in self._queues[BULK].values()),
+                "sent": self._sent,
+                "lines": self._lines,
+                "dropped": self._dropped,
+                "latency_avg": round(self._latency_total / self._lines, 3)
+                               if self._lines else 0,
+                "latency_max": round(self._latency_max, 3)}
+
+
+class Pomodoro():
+    """Pomodoro channel data structure. Keeps track of who is currently 
+    working in the channel, whether a pomodoro is running and in what mode.
+
+    Announcements are sent through <connection>, normally the bot's
+    MessageQueue, at URGENT priority. A bot keeps one of these for every
+    channel it is in, so they have __slots__ and share the mode table; active
+    is the time the channel last used the bot."""
+    __slots__ = ("_connection", "_channel", "_scheduler", "_timer",
+                 "_deadline", "_current_users", "_pomodoro_session", "_votes",
+                 "mode", "active")
+    _modes = {"fast":(25,5), "long":(50,10), "lazy":(45,15), "test":(1,1)}
+    # The phase transitions a snapshot may name as the pending one.
+    _phases = ("pomodoro_start", "pomodoro_break", "_break_over")
+
+    def __init__(self, connection, channel, scheduler):
+        self._connection = connection
+        self._channel = channel
+        self._scheduler = scheduler
+        self._timer = None
+        self._deadline = None
+        self._current_users = {}
+        self._pomodoro_session = False
+        self._votes = {}
+        self.mode = None
+        self.active = scheduler.now()
+
+    def initialize_pomodoro(self, mode, delay=300):
+        """Begin a registration period for a new pomodoro with the mode <mode>, 
+        mode is one of:
+
+        Fast: A 25-5 minutes worked/break time split.
+        Long: A 50-10 minutes worked/break time split.
+        Lazy: A 45/15 minutes worked/break time split."""
+        self.mode = mode.lower()
+        self._pomodoro_session = "work"
+        self._votes = {}
+        self._schedule_phase(self._scheduler.now() + delay,
+                             self.pomodoro_start, (self.mode,))
+        
+    def pomodoro_start(self, mode):
+        """Start a pomodoro session with the mode <mode>, mode is one of:
+
+        Fast: A 25-5 minutes worked/break time split.
+        Long: A 50-10 minutes worked/break time split.
+        Lazy: A 45/15 minutes worked/break time split."""
+        now = time.gmtime(self._deadline)
+        work_period = self._modes[mode][0]
+        now_to_end = (now.tm_min + work_period)
+        overflow = True if now_to_end % 60 < now.tm_min else False
+        start_above_ten = True if now.tm_min >= 10 else False
+        end_above_ten = True if now_to_end % 60 >= 10 else False
+        self._votes = {}
+        start = ":" + str(now.tm_min) if start_above_ten else ":0" + str(now.tm_min)
+        if overflow and end_above_ten:
+            end = ":" + str(now_to_end % 60) + " of the next hour."
+        elif overflow:
+            end = ":0" + str(now_to_end % 60) + " of the next hour."
+        elif end_above_ten:
+            end = ":" + str(now_to_end) + "."
+        else:
+            end = ":0" + str(now_to_end) + "."
+        self._connection.notice(self._channel,
+                                "Pomodoro starts at " + start + " and ends at "
+                                + end, URGENT)
+        self._schedule_phase(self._deadline + work_period * 60,
+                             self.pomodoro_break, (mode,))
+
+    def pomodoro_break(self, mode):
+        """Take a break from working of the length specified by the mode."""
+        break_period = str(self._modes[mode][1])
+        self._connection.notice(self._channel,
+                                break_period + " minute break.", URGENT)
+        self._connection.notice(self._channel,
+                                "Please register for the next pomodoro sometime"
+                                + " between now and the next " + break_period
+                                + " minutes.", URGENT)
+        self._current_users.clear()
+        self._pomodoro_session = "break"
+        self._schedule_phase(self._deadline + int(break_period) * 60,
+                             self._break_over, (mode,))
+
+    def _break_over(self, mode):
+        """Either iterate the pomodoro loop or clean up if nobody registered
+        during the break."""
+        self._timer = None
+        if self._current_users:
+            self.pomodoro_start(mode)
+        else:
+            self._pomodoro_session = False
+
+    def _schedule_phase(self, deadline, function, arguments):
+        """Schedule the next phase transition at the absolute time <deadline>.
+
+        Each deadline is computed from the previous one rather than from when
+        its callback actually ran, so the loop doesn't drift."""
+        self._deadline = deadline
+        self._timer = self._scheduler.schedule_at(deadline, function, arguments)
+
+    def pomodoro_stop(self):
+        """Set the current users to none so that the pomodoro stops after the
+        current break."""
+        self._current_users = {}
+
+    def pomodoro_cancel(self):
+        """Stop the pomodoro immediately, cancelling its pending phase."""
+        if self._timer:
+            self._scheduler.cancel(self._timer)
+            self._timer = None
+        self._current_users = {}
+        self._pomodoro_session = False
+
+    def snapshot(self):
+        """Return the state of the pomodoro as JSON serializable data, the
+        pending phase transition given by its name and absolute deadline."""
+        timer = self._timer
+        pending = (timer.function.__name__
+                   if timer and not timer.cancelled and not timer.popped
+                   else None)
+        return {"mode": self.mode,
+                "session": self._pomodoro_session,
+                "next": pending,
+                "deadline": self._deadline if pending else None,
+                "users": self._current_users,
+                "votes": {mode: sorted(nicks)
+                          for mode, nicks in self._votes.items()}}
+
+    @classmethod
+    def restore(cls, connection, channel, scheduler, state):
+        """Return a Pomodoro in the <state> returned by snapshot(), its
+        pending phase scheduled at the saved deadline. A deadline which passed
+        while the bot was down fires on the scheduler's next tick."""
+        session = cls(connection, channel, scheduler)
+        session.mode = state["mode"]
+        session._pomodoro_session = state["session"]
+        session._current_users = dict(state["users"])
+        session._votes = {mode: set(nicks)
+                          for mode, nicks in state["votes"].items()}
+        if state["next"] in cls._phases and session.mode in cls._modes:
+            session._schedule_phase(state["deadline"],
+                                    getattr(session, state["next"]),
+                                    (session.mode,))
+        return session
+
+    def register_nick(self, nickname, goal):
+        """Register a nickname for the current Pomodoro Session. Goal is the thing
+        that a user is working on for this session."""
+        if self._pomodoro_session:
+            if goal:
+                self._current_users[nickname] = goal
+            else:
+                self._current_users[nickname] = ""
+        else:
+            raise RegistrationError(nickname)
+
+    def vote(self, mode, nickname):
+        """Vote to change the mode to a different mode, returning how many
+        votes <mode> has now."""
+        if mode in self._votes:
+            self._votes[mode].add(nickname)
+        else:
+            self._votes[mode] = set((nickname,))
+        return len(self._votes[mode])
+        
+    def votes(self):
+        """Return the vote tallies for changing the mode."""
+        if self._votes:
+            return self._votes
+        else:
+            return False
+
+    def users(self):
+        """Return the current users."""
+        return self._current_users
+
+    def session_running(self):
+        """Return whether or not there is currently a session running.
+
+        This function can return one of three values, False, in which case there
+        is no session running at all, "work" in which case a work session is 
+        running, and "break" which means that a session is running but it is
+        currently in the break period."""
+        return self._pomodoro_session
+
+    class RegistrationError(Exception):
+        """Error raised when a nickname is registered when a pomodoro is not in
+        session."""
+        def __init__(self, nickname):
+            self._nickname = nickname
+
+        def __str__(self):
+            return repr(self._nickname)
+        
+Session = namedtuple("Session", ['datetime', 'type', 'goal'])
+
+
+class SessionLog():
+    """Columnar store of one nick's work sessions.
+
+    Session start times are kept as epoch seconds in an array('q'), pomodoro
+    types as small integer codes in an array('B') and goals as interned
+    strings, so a session costs a few bytes plus a pointer instead of a tuple
+    and three strings. Indexing and iteration still produce Session tuples.
+    Types which aren't modes of Pomodoro share one code and are looked up
+    in a side table of the log they are in."""
+    _mode_names = tuple(Pomodoro._modes)
+    _mode_codes = {mode: code for code, mode in enumerate(_mode_names)}
+    # Code of a mode outside Pomodoro._modes, such as those found in old
+    # logs. The mode itself is kept in the log's _other_modes by index.
+    _other_mode = 255
+    _datetime_format = "%Y-%m-%dT%H-%M-%SZ"
+
+    def __init__(self):
+        self._epochs = array('q')
+        self._modes = array('B')
+        self._goals = []
+        self._other_modes = None
+
+    @classmethod
+    def format_epoch(cls, epoch):
+        """Return the ISO 8601 datetime in UTC for <epoch>."""
+        return time.strftime(cls._datetime_format, time.gmtime(epoch))
+
+    @classmethod
+    def parse_datetime(cls, datetime):
+        """Return the epoch for an ISO 8601 datetime written by format_epoch."""
+        # strptime loads calendar on first use anyway, leave it until then.
+        import calendar
+        return calendar.timegm(time.strptime(datetime, cls._datetime_format))
+
+    def append(self, epoch, type, goal):
+        """Append a session that started at <epoch>."""
+        code = self._mode_codes.get(type, self._other_mode)
+        if code == self._other_mode:
+            if self._other_modes is None:
+                self._other_modes = {}
+            self._other_modes[len(self._epochs)] = type
+        self._epochs.append(epoch)
+        self._modes.append(code)
+        self._goals.append(sys.intern(goal) if isinstance(goal, str) else goal)
+
+    def append_record(self, record):
+        """Append a session from its [datetime, type, goal] JSON record."""
+        self.append(self.parse_datetime(record[0]), record[1], record[2])
+
+    def epoch(self, index):
+        """Return the epoch at which session <index> started."""
+        return self._epochs[index]
+
+    def find(self, epoch):
+        """Return the index of the first session starting at or after <epoch>."""
+        return bisect.bisect_left(self._epochs, epoch)
+
+    def __len__(self):
+        return len(self._epochs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        code = self._modes[index]
+        if code == self._other_mode:
+            mode = self._other_modes[index]
+        else:
+            mode = self._mode_names[code]
+        return Session(self.format_epoch(self._epochs[index]), mode,
+                       self._goals[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_json(self):
+        """Return the sessions as the list of [datetime, type, goal] records
+        used by the JSON log files."""
+        return [list(session) for session in self]
+    
+class Rollup():
+    """Running totals of the sessions logged by one nick or in one channel.
+
+    Besides session counts by mode and focused minutes it keeps a [sessions,
+    minutes] bucket for the latest UTC day and Monday-based week with a
+    session, both numbered from the epoch, and the length of the current and
+    longest run of consecutive days with a session. Only the latest day and
+    week are ever asked for, older buckets are dropped as new ones begin."""
+    __slots__ = ("sessions", "minutes", "by_mode", "daily", "weekly",
+                 "streak", "longest_streak", "last_day")
+
+    def __init__(self):
+        self.sessions = 0
+        self.minutes = 0
+        self.by_mode = {}
+        self.daily = {}
+        self.weekly = {}
+        self.streak = 0
+        self.longest_streak = 0
+        self.last_day = None
+
+    def add(self, epoch, type, minutes):
+        """Count a session of <type> worth <minutes> which started at <epoch>."""
+        day = epoch // 86400
+        week = (day + 3) // 7
+        self.sessions += 1
+        self.minutes += minutes
+        self.by_mode[type] = self.by_mode.get(type, 0) + 1
+        for buckets, key in ((self.daily, day), (self.weekly, week)):
+            if key in buckets:
+                buckets[key][0] += 1
+                buckets[key][1] += minutes
+            elif not buckets or key > max(buckets):
+                buckets.clear()
+                buckets[key] = [1, minutes]
+        if self.last_day is None or day > self.last_day + 1:
+            self.streak = 1
+        elif day == self.last_day + 1:
+            self.streak += 1
+        if self.last_day is None or day > self.last_day:
+            self.last_day = day
+        self.longest_streak = max(self.longest_streak, self.streak)
+
+    def copy(self):
+        rollup = Rollup()
+        rollup.sessions = self.sessions
+        rollup.minutes = self.minutes
+        rollup.by_mode = dict(self.by_mode)
+        rollup.daily = {day: list(bucket) for day, bucket in self.daily.items()}
+        rollup.weekly = {week: list(bucket)
+                         for week, bucket in self.weekly.items()}
+        rollup.streak = self.streak
+        rollup.longest_streak = self.longest_streak
+        rollup.last_day = self.last_day
+        return rollup
+
+    def to_json(self):
+        return {"sessions": self.sessions, "minutes": self.minutes,
+                "by_mode": self.by_mode,
+                "daily": list(self.daily.items()),
+                "weekly": list(self.weekly.items()),
+                "streak": self.streak, "longest_streak": self.longest_streak,
+                "last_day": self.last_day}
+
+    @classmethod
+    def from_json(cls, record):
+        rollup = cls()
+        rollup.sessions = record["sessions"]
+        rollup.minutes = record["minutes"]
+        rollup.by_mode = record["by_mode"]
+        # Files from before the buckets were bounded hold every day and week.
+        for buckets, saved in ((rollup.daily, record["daily"]),
+                               (rollup.weekly, record["weekly"])):
+            if saved:
+                key, bucket = max(saved)
+                buckets[key] = bucket
+        rollup.streak = record["streak"]
+        rollup.longest_streak = record["longest_streak"]
+        rollup.last_day = record["last_day"]
+        return rollup
+
+
+class SessionStats():
+    """Rollups of the logged sessions per nick, per channel and overall,
+    updated as each session is logged so queries never scan a history.
+
+    Focused minutes are the work period of the session's mode in
+    Pomodoro._modes."""
+    periods = ("all", "today", "week")
+
+    def __init__(self):
+        self._nicks = {}
+        self._channels = {}
+        self._total = Rollup()
+
+    def add(self, nick, channel, epoch, type):
+        """Count a session of <type> logged by <nick> in <channel>, which may
+        be None for sessions from before channels were tracked."""
+        minutes = Pomodoro._modes[type][0] if type in Pomodoro._modes else 0
+        for table, name in ((self._nicks, nick), (self._channels, channel)):
+            if name is None:
+                continue
+            if name not in table:
+                table[name] = Rollup()
+            table[name].add(epoch, type, minutes)
+        self._total.add(epoch, type, minutes)
+
+    def rollup(self, name=None):
+        """Return the Rollup for a nick or #channel, the overall one if <name>
+        is None, or None if nothing was logged under <name>."""
+        if name is None:
+            return self._total
+        if is_channel(name):
+            return self._channels.get(name.lower())
+        return self._nicks.get(name.lower())
+
+    def summary(self, name, period, now):
+        """Return a dict summarising the sessions of <name> over <period>,
+        one of SessionStats.periods, as of the epoch <now>."""
+        rollup = self.rollup(name)
+        if rollup is None:
+            return None
+        day = int(now) // 86400
+        if period == "today":
+            sessions, minutes = rollup.daily.get(day, (0, 0))
+            return {"name": name, "period": period, "sessions": sessions,
+                    "minutes": minutes}
+        if period == "week":
+            sessions, minutes = rollup.weekly.get((day + 3) // 7, (0, 0))
+            return {"name": name, "period": period, "sessions": sessions,
+                    "minutes": minutes}
+        current = (rollup.streak if rollup.last_day is not None
+                   and rollup.last_day >= day - 1 else 0)
+        return {"name": name, "period": "all", "sessions": rollup.sessions,
+                "minutes": rollup.minutes, "by_mode": dict(rollup.by_mode),
+                "streak": current, "longest_streak": rollup.longest_streak}
+
+    def copy(self):
+        """Return a copy which later sessions don't change."""
+        stats = SessionStats()
+        stats._nicks = {nick: rollup.copy()
+                        for nick, rollup in self._nicks.items()}
+        stats._channels = {channel: rollup.copy()
+                           for channel, rollup in self._channels.items()}
+        stats._total = self._total.copy()
+        return stats
+
+    def to_json(self):
+        return {"nicks": {nick: rollup.to_json()
+                          for nick, rollup in self._nicks.items()},
+                "channels": {channel: rollup.to_json()
+                             for channel, rollup in self._channels.items()},
+                "total": self._total.to_json()}
+
+    @classmethod
+    def from_json(cls, record):
+        stats = cls()
+        stats._nicks = {nick: Rollup.from_json(rollup)
+                        for nick, rollup in record["nicks"].items()}
+        stats._channels = {channel: Rollup.from_json(rollup)
+                           for channel, rollup in record["channels"].items()}
+        stats._total = Rollup.from_json(record["total"])
+        return stats
+
+
+class GoalIndex():
+    """Inverted index from the words of registered goals to the sessions they
+    were registered for, kept up to date as sessions are logged.
+
+    Postings are stored per word as an array of (nick id, session index)
+    pairs, the session index being the session's position in the nick's
+    history. Every indexed session is also appended to the file at <path> as
+    a [nick, session index, words] line when the logbook commits, reading
+    those lines back rebuilds the index at startup without touching the
+    logs. The file is written through <pool>, see WorkerPool."""
+    _word = re.compile(r"\w+")
+    stopwords = frozenset(["a", "an", "and", "at", "for", "i", "i'm", "in", "is",
+                           "it", "my", "of", "on", "the", "to", "with"])
+
+    def __init__(self, path, pool=None):
+        self._path = path
+        self._pool = pool or workers.WorkerPool(0)
+        self._nicks = []
+        self._nick_ids = {}
+        self._counts = []
+        self._postings = {}
+        self._unsaved = []
+        self.sessions = 0
+
+    @classmethod
+    def words(cls, text):
+        """Return the set of indexed words in <text>."""
+        if not text:
+            return set()
+        return set(word for word in cls._word.findall(text.lower())
+                   if word not in cls.stopwords)
+
+    def add(self, nick, goal):
+        """Index the next session of <nick>, registered with <goal>."""
+        words = sorted(self.words(goal))
+        nick_id = self._nick_id(nick)
+        index = self._counts[nick_id]
+        self._insert(nick_id, index, words)
+        self._unsaved.append([nick, index, words])
+
+    def _nick_id(self, nick):
+        if nick not in self._nick_ids:
+            self._nick_ids[nick] = len(self._nicks)
+            self._nicks.append(nick)
+            self._counts.append(0)
+        return self._nick_ids[nick]
+
+    def _insert(self, nick_id, index, words):
+        for word in words:
+            if word in self._postings:
+                self._postings[word].extend((nick_id, index))
+            else:
+                self._postings[word] = array('I', (nick_id, index))
+        self._counts[nick_id] = max(self._counts[nick_id], index + 1)
+        self.sessions += 1
+
+    def search(self, text, limit=10):
+        """Return up to <limit> nicks whose goals match the words in <text>.
+
+        Nicks matching more of the words rank first, then by the sum over
+        matched words of how often the nick used the word weighted by how rare
+        the word is. Each result lists the nick's matching session indexes."""
+        matches = {}
+        for word in self.words(text):
+            postings = self._postings.get(word)
+            if not postings:
+                continue
+            weight = math.log(1 + self.sessions / (len(postings) // 2))
+            for position in range(0, len(postings), 2):
+                nick_id = postings[position]
+                if nick_id not in matches:
+                    matches[nick_id] = [set(), 0.0, set()]
+                match = matches[nick_id]
+                match[0].add(word)
+                match[1] += weight
+                match[2].add(postings[position + 1])
+        ranked = sorted(matches.items(),
+                        key=lambda item: (len(item[1][0]), item[1][1]),
+                        reverse=True)
+        return [{"nick": self._nicks[nick_id],
+                 "score": round(match[1], 3),
+                 "words": sorted(match[0]),
+                 "sessions": sorted(match[2])}
+                for nick_id, match in ranked[:limit]]
+
+    def save(self):
+        """Append the sessions indexed since the last save to the index file."""
+        if not self._unsaved:
+            return True
+        self._pool.submit(self._path, append_file, self._path,
+                          "".join(json.dumps(line) + "\n"
+                                  for line in self._unsaved))
+        self._unsaved = []
+        return True
+
+    def save_all(self):
+        """Write the index file from scratch after a rebuild."""
+        self._pool.submit(self._path, replace_file, self._path,
+                          "".join(json.dumps(line) + "\n"
+                                  for line in self._unsaved))
+        self._unsaved = []
+        return True
+
+    def load(self):
+        """Rebuild the index from its file, returning False if there is none."""
+        try:
+            infile = open(self._path)
+        except FileNotFoundError:
+            return False
+        for line in infile:
+            try:
+                nick, index, words = json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-append.
+                continue
+            self._insert(self._nick_id(nick), index, words)
+        infile.close()
+        return True
+
+
+def append_file(path, text, header=None):
+    """Append the lines in <text> to the file at <path>, beginning a new
+    file with the line <header>. If a crash tore the file's last line, a
+    newline ends it first so the torn line doesn't swallow the first of
+    these."""
+    start = time.perf_counter()
+    outfile = open(path, "ab+")
+    end = outfile.seek(0, os.SEEK_END)
+    if end:
+        outfile.seek(end - 1)
+        if outfile.read(1) != b"\n":
+            text = "\n" + text
+    elif header:
+        text = header + text
+    outfile.write(text.encode())
+    outfile.close()
+    LOGBOOK_SECONDS.labels("append").observe(time.perf_counter() - start)
+
+
+def sync_directory(path):
+    """Flush the entries of the directory holding <path> to the disk, where
+    the platform can open a directory to do so."""
+    try:
+        descriptor = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+def replace_file(path, text, obsolete=None):
+    """Atomically replace the file at <path> with <text>, then remove the
+    file at <obsolete> which it supersedes.
+
+    The new contents reach the disk before the rename, and the rename before
+    <obsolete> is removed, so a power loss leaves either file whole."""
+    start = time.perf_counter()
+    temp_path = path + ".tmp"
+    outfile = open(temp_path, "w")
+    outfile.write(text)
+    outfile.flush()
+    os.fsync(outfile.fileno())
+    outfile.close()
+    os.replace(temp_path, path)
+    sync_directory(path)
+    if obsolete:
+        try:
+            os.remove(obsolete)
+        except FileNotFoundError:
+            pass
+    LOGBOOK_SECONDS.labels("replace").observe(time.perf_counter() - start)
+
+
+def record_channel(record):
+    """Return the channel of a session's JSON <record>, None for sessions
+    logged outside a channel or before channels were recorded."""
+    return record[3] if len(record) > 3 else None
+
+
+def journal_header():
+    """Return the first line of a new journal, naming it with a random id."""
+    return json.dumps({"journal": os.urandom(8).hex()}) + "\n"
+
+
+def read_journal_id(path):
+    """Return the id in the header of the journal at <path>, None if there is
+    no journal or it is from before journals had one."""
+    try:
+        infile = open(path)
+    except FileNotFoundError:
+        return None
+    line = infile.readline()
+    infile.close()
+    try:
+        header = json.loads(line)
+    except ValueError:
+        return None
+    return header["journal"] if isinstance(header, dict) else None
+
+
+def read_journal(path):
+    """Return the id and the records of the journal at <path>. The id is None
+    for journals from before they had one, the records are None if there is
+    no journal."""
+    try:
+        infile = open(path)
+    except FileNotFoundError:
+        return None, None
+    journal = None
+    records = []
+    for line in infile:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # A line torn by a crash mid-append.
+            continue
+        if isinstance(record, dict):
+            journal = record["journal"]
+        else:
+            records.append(record)
+    infile.close()
+    return journal, records
+
+
+def read_log(path, journal_path):
+    """Return the records of the JSON log file at <path> followed by those of
+    the journal at <journal_path> it doesn't hold yet, with the journal's id
+    and how many records it has, None if there is no journal.
+
+    A log file records the id of the journal it last folded and how many of
+    its records that were. Should a crash leave the journal behind after the
+    log file was replaced, those records are skipped rather than read twice.
+    Log files from before this are plain lists of records."""
+    try:
+        infile = open(path)
+        log = json.load(infile)
+        infile.close()
+    except FileNotFoundError:
+        log = []
+    if isinstance(log, list):
+        log = {"journal": None, "folded": 0, "sessions": log}
+    sessions = log["sessions"]
+    journal, records = read_journal(journal_path)
+    if records is None:
+        return sessions, None, None
+    folded = (log["folded"] if journal is not None
+              and journal == log["journal"] else 0)
+    sessions.extend(records[folded:])
+    return sessions, journal, len(records)
+
+
+def fold_journal(path, journal_path):
+    """Fold the journal at <journal_path> into the JSON log file at <path> and
+    remove the journal, see read_log."""
+    start = time.perf_counter()
+    sessions, journal, count = read_log(path, journal_path)
+    if count is None:
+        return
+    replace_file(path, json.dumps({"journal": journal, "folded": count,
+                                   "sessions": sessions}), journal_path)
+    LOGBOOK_SECONDS.labels("fold").observe(time.perf_counter() - start)
+
+
+class WorkLogbook():
+    """Data structure representing the work logbook for pomodoro sessions.
+
+    Each user's sessions are stored on disk in two parts: a compacted JSON log
+    file, <nick>.json, and an append-only journal, <nick>.jsonl, holding one
+    JSON record per line for sessions logged since the last compaction. For
+    each session the datetime, type of pomodoro, and goal registered with are
+    recorded, as well as the channel for sessions logged in one, so the
+    per channel rollups can be rebuilt from the records. Each journal starts
+    with a line holding its id, which lets the log file say which journal
+    records it already holds, see read_log.
+
+    Logged sessions are group committed to the journals once batch_size of them
+    are pending or commit_interval seconds have passed since the last commit.
+    A periodic compaction pass folds the journals back into the JSON log files.
+
+    Only an index of which nicks have logs is built at startup. A nick's
+    history is read from disk the first time it is needed and kept in an LRU
+    cache holding at most cache_size histories.
+
+    The logbook is shared between the bot and the export server's threads, so
+    methods that touch the cache or the pending batch hold a lock. The lock is
+    never held across disk I/O: a history is read on the pool while sessions
+    logged in the meantime are collected, and those are added to it once it
+    is loaded.
+
+    SessionStats rollups are updated as sessions are logged and saved to
+    .stats.json at each compaction, together with the id of each journal and
+    how many of its records they already count. At startup the rollups are
+    loaded from that file and only the journal records after those are
+    added, all of them for a journal begun since the save. A logbook
+    without the file gets its rollups rebuilt from every log once. The
+    GoalIndex over registered goals is kept in .goal_index.jsonl and rebuilt
+    the same way when that file is missing.
+
+    The files are written through <pool>, a WorkerPool keyed by nick, so the
+    methods below only queue the writes and each nick's writes reach the disk
+    in order. A nick's log is read, and its journal folded into its log file,
+    by tasks queued behind its writes as well. Without a pool the writes and
+    reads happen inline."""
+    # The cache statistics which only ever grow, see metrics.stat_samples.
+    cache_counters = ("hits", "misses", "evictions")
+
+    def __init__(self, directory=".", batch_size=64, commit_interval=10,
+                 cache_size=1024, clock=time.time, pool=None):
+        self._directory = directory
+        self._batch_size = batch_size
+        self._commit_interval = commit_interval
+        self._cache_size = cache_size
+        self._clock = clock
+        self._index = set()
+        self._logbook = OrderedDict()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._cache_evictions = 0
+        self._pending = []
+        self._dirty = set()
+        self._journaled = {}
+        self._loading = {}
+        self._last_commit = clock()
+        self._lock = RLock()
+        self._pool = pool or workers.WorkerPool(0)
+        self.stats = SessionStats()
+        self.goals = GoalIndex(os.path.join(directory, ".goal_index.jsonl"),
+                               self._pool)
+        self.load()
+
+    def log_session(self, nick, type, goal, channel=None):
+        """Log a work session for a given nick.
+
+        For each session the datetime, type of pomodoro, and goal registered 
+        with are recorded, along with the channel if there is one. The session
+        is queued for the next group commit, the nick's history does not have
+        to be loaded to append to it."""
+        with self._lock:
+            epoch = int(self._clock())
+            session = [SessionLog.format_epoch(epoch), type, goal]
+            if channel:
+                channel = channel.lower()
+                session.append(channel)
+            nick = nick.lower()
+            self._index.add(nick)
+            self.stats.add(nick, channel or None, epoch, type)
+            self.goals.add(nick, goal)
+            if nick in self._logbook:
+                self._logbook[nick].append(epoch, type, goal)
+            if nick in self._loading:
+                self._loading[nick][1].append(session)
+            self._pending.append((nick, session))
+            if (len(self._pending) >= self._batch_size
+                or self._clock() - self._last_commit >= self._commit_interval):
+                self.commit()
+            return True
+
+    def history(self, nick):
+        """Return the SessionLog of sessions logged by <nick>, loading it from
+        disk if it isn't cached.
+
+        The log is read by a task queued behind the nick's writes, so it holds
+        every session committed so far. The sessions still pending, and those
+        logged until the read is done, are collected in _loading and added to
+        it afterwards. Threads missing the same nick share one read."""
+        nick = nick.lower()
+        with self._lock:
+            if nick in self._logbook:
+                self._cache_hits += 1
+                self._logbook.move_to_end(nick)
+                return self._logbook[nick]
+            self._cache_misses += 1
+            if nick not in self._loading:
+                logged = [session for pending_nick, session in self._pending
+                          if pending_nick == nick]
+                self._loading[nick] = (self._pool.submit_result(
+                    nick, self._load_one, nick), logged)
+            loading = self._loading[nick]
+        try:
+            sessions = loading[0].result()
+        except Exception:
+            with self._lock:
+                if self._loading.get(nick) is loading:
+                    del self._loading[nick]
+            raise
+        with self._lock:
+            if self._loading.get(nick) is not loading:
+                # Another thread finished the read and added the sessions.
+                return self._logbook.get(nick, sessions)
+            del self._loading[nick]
+            for session in loading[1]:
+                sessions.append_record(session)
+            self._logbook[nick] = sessions
+            while len(self._logbook) > self._cache_size:
+                self._logbook.popitem(last=False)
+                self._cache_evictions += 1
+            return sessions
+
+    def nicks(self):
+        """Return the set of nicks which have logged a session."""
+        return self._index
+
+    def cache_stats(self):
+        """Return the hit, miss and eviction counters of the history cache."""
+        return {"hits": self._cache_hits,
+                "misses": self._cache_misses,
+                "evictions": self._cache_evictions,
+                "loaded": len(self._logbook)}
+
+    def _path(self, nick, extension):
+        """Return the path of the file with <extension> belonging to <nick>."""
+        return os.path.join(self._directory, nick + extension)
+
+    def commit(self):
+        """Queue every pending session for appending to its nick's journal.
+
+        Each journal touched by the batch is opened once and written with a
+        single call, no matter how many sessions the nick logged."""
+        with self._lock:
+            if not self._pending:
+                self._last_commit = self._clock()
+                return True
+            start = time.perf_counter()
+            batches = {}
+            for nick, session in self._pending:
+                if nick in batches:
+                    batches[nick].append(json.dumps(session) + "\n")
+                else:
+                    batches[nick] = [json.dumps(session) + "\n"]
+            for nick in batches:
+                self._pool.submit(nick, append_file, self._path(nick, ".jsonl"),
+                                  "".join(batches[nick]), journal_header())
+                self._dirty.add(nick)
+                self._journaled[nick] = (self._journaled.get(nick, 0)
+                                         + len(batches[nick]))
+            self.goals.save()
+            self._pending = []
+            self._last_commit = self._clock()
+            LOGBOOK_SECONDS.labels("commit").observe(time.perf_counter() - start)
+            return True
+
+    def flush(self):
+        """Commit the pending sessions and wait until every queued write has
+        reached the disk."""
+        self.commit()
+        self._pool.flush()
+        return True
+
+    def compact(self):
+        """Fold the journals written since the last compaction into the JSON
+        log files. The folding is queued on the pool, see save_one."""
+        with self._lock:
+            self.commit()
+            self.save_stats()
+            for nick in list(self._dirty):
+                self.save_one(nick)
+            return True
+
+    def save_all(self):
+        """Save the WorkLogbook to disk.
+
+        The WorkLogbook is saved to disk in a JSON format. Each nick's log is
+        stored in a seperate file."""
+        with self._lock:
+            self.commit()
+            for nick in self._index:
+                self.save_one(nick)
+            return True
+
+    def save_one(self, nick):
+        """Save the WorkLogbook entries for a given nick to disk.
+
+        A task folding the nick's journal into <nick>.json is queued behind
+        its writes, it reads both files itself so the history doesn't have to
+        be loaded or serialized here."""
+        with self._lock:
+            self.commit()
+            self._pool.submit(nick, fold_journal, self._path(nick, ".json"),
+                              self._path(nick, ".jsonl"))
+            self._dirty.discard(nick)
+            self._journaled.pop(nick, None)
+            return True
+
+    def save_stats(self):
+        """Save a copy of the rollups, and how many records of each journal
+        they count, to .stats.json.
+
+        The counts have to match the journals on disk, so the file is only
+        written, and serialized, on the pool once every write queued before
+        it is done."""
+        with self._lock:
+            self._pool.submit_after_all(self._write_stats, self.stats.copy(),
+                                        dict(self._journaled))
+            return True
+
+    def _write_stats(self, stats, journaled):
+        """Write <stats> to .stats.json with the id of each journal and the
+        count of its records in <journaled>."""
+        counts = {nick: [read_journal_id(self._path(nick, ".jsonl")), count]
+                  for nick, count in journaled.items()}
+        replace_file(os.path.join(self._directory, ".stats.json"),
+                     json.dumps({"journaled": counts,
+                                 "stats": stats.to_json()}))
+
+    def load(self):
+        """Index the WorkLogbook on disk.
+
+        Only the directory listing is read, the logs themselves are loaded on
+        demand by history(). A journal left behind by an unclean shutdown marks
+        the nick for the next compaction."""
+        start = time.perf_counter()
+        for filename in os.listdir(self._directory):
+            nick, extension = os.path.splitext(filename)
+            if nick.startswith("."):
+                continue
+            if extension == ".json":
+                self._index.add(nick)
+            elif extension == ".jsonl":
+                self._index.add(nick)
+                self._dirty.add(nick)
+        rebuild_stats = not self._load_stats()
+        rebuild_goals = not self.goals.load()
+        if rebuild_stats or rebuild_goals:
+            self._rebuild(rebuild_stats, rebuild_goals)
+        LOGBOOK_SECONDS.labels("load").observe(time.perf_counter() - start)
+        return True
+
+    def _rebuild(self, stats, goals):
+        """Rebuild the rollups if <stats> and the goal index if <goals> from
+        every log in a single pass."""
+        for nick in self._index:
+            records = read_log(self._path(nick, ".json"),
+                               self._path(nick, ".jsonl"))[0]
+            for record in records:
+                if stats:
+                    self.stats.add(nick, record_channel(record),
+                                   SessionLog.parse_datetime(record[0]),
+                                   record[1])
+                if goals:
+                    self.goals.add(nick, record[2])
+        if goals:
+            self.goals.save_all()
+
+    def search(self, text, limit=10):
+        """Return the nicks whose registered goals best match <text>, see
+        GoalIndex.search."""
+        with self._lock:
+            return self.goals.search(text, limit)
+
+    def summary(self, name, period, now):
+        """Return the rollup summary of <name>, see SessionStats.summary."""
+        with self._lock:
+            return self.stats.summary(name, period, now)
+
+    def _load_stats(self):
+        """Load the rollups from .stats.json and add the journal records
+        written after it was saved. Returns False if there is no saved copy."""
+        try:
+            infile = open(os.path.join(self._directory, ".stats.json"))
+            saved = json.load(infile)
+            infile.close()
+        except FileNotFoundError:
+            return False
+        self.stats = SessionStats.from_json(saved["stats"])
+        for nick in self._dirty:
+            journal, records = read_journal(self._path(nick, ".jsonl"))
+            records = records or []
+            counted = saved["journaled"].get(nick, 0)
+            # Files from before journal ids hold plain counts.
+            if isinstance(counted, list):
+                counted = counted[1] if counted[0] == journal else 0
+            for session in records[counted:]:
+                self.stats.add(nick, record_channel(session),
+                               SessionLog.parse_datetime(session[0]),
+                               session[1])
+            self._journaled[nick] = len(records)
+        return True
+
+    def _load_one(self, nick):
+        """Read the sessions of <nick> from its JSON log file and journal."""
+        start = time.perf_counter()
+        session_log = SessionLog()
+        sessions = read_log(self._path(nick, ".json"),
+                            self._path(nick, ".jsonl"))[0]
+        for session in sessions:
+            session_log.append_record(session)
+        LOGBOOK_SECONDS.labels("load_one").observe(time.perf_counter() - start)
+        return session_log
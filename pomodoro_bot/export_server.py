@@ -0,0 +1,330 @@
+"""HTTP export service for the work logs, served from the WorkLogbook in memory.
+
+GET /<nick>.<format>[?since=<time>&until=<time>]
+GET /stats[?name=<nick or channel>&period=<all, today or week>]
+GET /search?q=<words>[&limit=<results>]
+GET /metrics
+
+The format is one of json, a list of [datetime, type, goal] records, jsonl,
+csv or ics. since and until take a Unix timestamp, a date
+such as 2016-04-01 or a datetime in the log files' format and filter the
+sessions by when they started, an until date includes the whole day. /stats
+answers from the logbook's precomputed rollups, for the whole logbook when no
+name is given. /search ranks nicks by how well their registered goals match
+the words, using the logbook's goal index. /metrics exposes the bot's
+instrumentation in the Prometheus text format.
+
+Responses carry an ETag and a Last-Modified header for revalidation, are gzip
+encoded when the client accepts it and are streamed with chunked transfer
+encoding, or unframed on a connection that is then closed for HTTP/1.0
+clients. A HEAD request gets the headers of the GET response alone.
+Exporter builds responses without knowing how they are sent: ExportServer
+handles every connection on its own thread, aio.py serves the same responses
+from an asyncio event loop."""
+import io
+import csv
+import json
+import time
+import zlib
+import hashlib
+import calendar
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+from urllib.parse import urlsplit
+from email.utils import formatdate
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from . import metrics
+
+
+def parse_time(value, end=False):
+    """Parse a since/until query value into a Unix timestamp. With <end> a
+    bare date stands for the last second of that day."""
+    if value.isdigit():
+        return int(value)
+    for layout in ("%Y-%m-%dT%H-%M-%SZ", "%Y-%m-%dT%H:%M:%SZ"):
+        try:
+            return calendar.timegm(time.strptime(value, layout))
+        except ValueError:
+            pass
+    day = calendar.timegm(time.strptime(value, "%Y-%m-%d"))
+    return day + 86399 if end else day
+
+
+def export_json(nick, sessions, start, stop, modes):
+    yield "["
+    for index in range(start, stop):
+        yield (", " if index > start else "") + json.dumps(list(sessions[index]))
+    yield "]"
+
+
+def export_jsonl(nick, sessions, start, stop, modes):
+    for index in range(start, stop):
+        yield json.dumps(list(sessions[index])) + "\n"
+
+
+def export_csv(nick, sessions, start, stop, modes):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["datetime", "type", "goal"])
+    for index in range(start, stop):
+        writer.writerow(sessions[index])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ics_text(text):
+    """Escape <text> for an iCalendar TEXT value."""
+    return (text.replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+
+def _ics_line(line):
+    """Fold an iCalendar content line at 75 octets."""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    folded = []
+    while len(encoded) > 75:
+        cut = 75 if not folded else 74
+        # Don't split a multibyte character.
+        while cut and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        folded.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+    folded.append(encoded.decode())
+    return "\r\n ".join(folded) + "\r\n"
+
+
+def export_ics(nick, sessions, start, stop, modes):
+    layout = "%Y%m%dT%H%M%SZ"
+    yield ("BEGIN:VCALENDAR\r\nVERSION:2.0\r\n"
+           "PRODID:-//pomodoro-bot//work log export//EN\r\n")
+    stamp = time.strftime(layout, time.gmtime())
+    for index in range(start, stop):
+        datetime, type, goal = sessions[index]
+        epoch = sessions.epoch(index)
+        work_minutes = modes[type][0] if type in modes else 25
+        summary = goal.strip() if goal and goal.strip() else "Pomodoro"
+        yield ("BEGIN:VEVENT\r\n"
+               + _ics_line("UID:" + nick + "-" + str(epoch) + "-" + str(index)
+                           + "@pomodoro-bot")
+               + "DTSTAMP:" + stamp + "\r\n"
+               + "DTSTART:" + time.strftime(layout, time.gmtime(epoch)) + "\r\n"
+               + "DTEND:" + time.strftime(layout,
+                                          time.gmtime(epoch + work_minutes * 60))
+               + "\r\n"
+               + _ics_line("SUMMARY:" + _ics_text(summary))
+               + _ics_line("CATEGORIES:" + _ics_text(str(type)))
+               + "END:VEVENT\r\n")
+    yield "END:VCALENDAR\r\n"
+
+
+FORMATS = {"json": ("application/json", export_json),
+           "jsonl": ("application/x-ndjson", export_jsonl),
+           "csv": ("text/csv; charset=utf-8", export_csv),
+           "ics": ("text/calendar; charset=utf-8", export_ics)}
+
+
+class Exporter():
+    """Answer requests for the work logs in <logbook>, independently of the
+    server they arrive through. <modes> maps pomodoro types to their (work,
+    break) minutes, as in Pomodoro._modes."""
+    chunk_size = 64 * 1024
+
+    def __init__(self, logbook, modes):
+        self.logbook = logbook
+        self.modes = modes
+
+    def export_nick(self, path):
+        """Return the nick whose log a request for <path> exports, or None."""
+        nick, dot, extension = unquote(urlsplit(path).path.lstrip("/")).rpartition(".")
+        if (not dot or extension not in FORMATS or "/" in nick
+            or nick.lower() not in self.logbook.nicks()):
+            return None
+        return nick
+
+    def respond(self, path, headers, sessions=None):
+        """Return the (status, headers, body) response to a GET of <path>
+        with the request <headers>. The body is an iterable of bytes, sent
+        with chunked transfer encoding when the headers say so. <sessions> is
+        the log of the nick the path exports, if the caller already has it."""
+        url = urlsplit(path)
+        if url.path == "/stats":
+            return self.stats(parse_qs(url.query))
+        if url.path == "/search":
+            return self.search(parse_qs(url.query))
+        if url.path == "/metrics":
+            body = metrics.REGISTRY.render().encode()
+            return 200, [("Content-Type", "text/plain; version=0.0.4"),
+                         ("Content-Length", str(len(body)))], [body]
+        nick = self.export_nick(path)
+        if nick is None:
+            return self.error(404)
+        extension = url.path.rpartition(".")[2]
+        query = parse_qs(url.query)
+        try:
+            since = parse_time(query["since"][0]) if "since" in query else None
+            until = (parse_time(query["until"][0], end=True)
+                     if "until" in query else None)
+        except ValueError:
+            return self.error(400, "Bad since or until time.")
+        if sessions is None:
+            sessions = self.logbook.history(nick)
+        # Sessions are only ever appended, so everything below this count
+        # stays put while the response is streamed.
+        count = len(sessions)
+        start = sessions.find(since) if since is not None else 0
+        stop = min(count, sessions.find(until + 1)) if until is not None else count
+        last_modified = sessions.epoch(count - 1) if count else 0
+        gzipped = "gzip" in headers.get("Accept-Encoding", "")
+        etag = '"' + hashlib.sha1(repr((nick.lower(), count, last_modified,
+                                        extension, since, until)).encode()
+                                  ).hexdigest()[:24] + ("-gz" if gzipped else "") + '"'
+        validators = [("ETag", etag),
+                      ("Last-Modified", formatdate(last_modified, usegmt=True))]
+        if self._not_modified(headers, etag, last_modified):
+            return 304, validators, []
+        content_type, export = FORMATS[extension]
+        response_headers = ([("Content-Type", content_type)] + validators
+                            + [("Cache-Control", "no-cache"),
+                               ("Vary", "Accept-Encoding"),
+                               ("Transfer-Encoding", "chunked")])
+        if gzipped:
+            response_headers.append(("Content-Encoding", "gzip"))
+        return 200, response_headers, self._body(
+            export(nick.lower(), sessions, start, stop, self.modes), gzipped)
+
+    def _body(self, pieces, gzipped):
+        """Join the exported <pieces> into chunks of about chunk_size bytes,
+        compressing them if <gzipped>."""
+        compressor = zlib.compressobj(wbits=31) if gzipped else None
+        buffered = []
+        size = 0
+        for piece in pieces:
+            buffered.append(piece)
+            size += len(piece)
+            if size >= self.chunk_size:
+                data = "".join(buffered).encode()
+                yield compressor.compress(data) if compressor else data
+                buffered = []
+                size = 0
+        data = "".join(buffered).encode()
+        yield compressor.compress(data) if compressor else data
+        if compressor:
+            yield compressor.flush()
+
+    def stats(self, query):
+        """Return the rollup summary asked for by the /stats <query>."""
+        name = query["name"][0] if "name" in query else None
+        period = query["period"][0] if "period" in query else "all"
+        if period not in self.logbook.stats.periods:
+            return self.error(400, "Unknown period.")
+        summary = self.logbook.summary(name, period, time.time())
+        if summary is None:
+            return self.error(404)
+        return self._json(summary)
+
+    def search(self, query):
+        """Return the goal search results asked for by the /search <query>."""
+        if "q" not in query:
+            return self.error(400, "Missing q.")
+        try:
+            limit = min(int(query["limit"][0]), 100) if "limit" in query else 10
+        except ValueError:
+            return self.error(400, "Bad limit.")
+        return self._json(self.logbook.search(query["q"][0], limit))
+
+    def _json(self, value):
+        body = json.dumps(value).encode()
+        return 200, [("Content-Type", "application/json"),
+                     ("Content-Length", str(len(body))),
+                     ("Cache-Control", "no-cache")], [body]
+
+    def error(self, status, message=None):
+        """Return a plain text error response."""
+        body = (str(status) + " " + HTTPStatus(status).phrase
+                + (": " + message if message else "") + "\n").encode()
+        return status, [("Content-Type", "text/plain; charset=utf-8"),
+                        ("Content-Length", str(len(body)))], [body]
+
+    def _not_modified(self, headers, etag, last_modified):
+        """Return whether the client's cached copy is still current."""
+        if_none_match = headers.get("If-None-Match")
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags or "W/" + etag in tags
+        if_modified_since = headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return (last_modified
+                        <= parsedate_to_datetime(if_modified_since).timestamp())
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+def chunked(headers, body):
+    """Yield the bytes of <body> as sent on the wire, framed as chunks if the
+    response <headers> ask for chunked transfer encoding."""
+    if ("Transfer-Encoding", "chunked") not in headers:
+        for data in body:
+            yield data
+        return
+    for data in body:
+        if data:
+            yield b"%x\r\n" % len(data) + data + b"\r\n"
+    yield b"0\r\n\r\n"
+
+
+def unchunked(headers):
+    """Return the response <headers> for an HTTP/1.0 client, which doesn't
+    know chunked transfer encoding. Its body is sent as is and ends when the
+    connection is closed."""
+    return [header for header in headers
+            if header != ("Transfer-Encoding", "chunked")]
+
+
+class ExportHandler(BaseHTTPRequestHandler):
+    """Serve one user's work log in the format named by the path's extension."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        for data in self._send_head():
+            self.wfile.write(data)
+
+    def do_HEAD(self):
+        """Send the status and headers a GET would get, without the body."""
+        self._send_head()
+
+    def _send_head(self):
+        """Send the status and headers of the response to the request and
+        return its body as it goes on the wire, which is only produced if it
+        is iterated."""
+        status, headers, body = self.server.exporter.respond(self.path,
+                                                             self.headers)
+        if self.request_version != "HTTP/1.1":
+            headers = unchunked(headers) + [("Connection", "close")]
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        return chunked(headers, body)
+
+
+class ExportServer(ThreadingHTTPServer):
+    """Threaded HTTP server exporting the work logs in <logbook>. <modes> maps
+    pomodoro types to their (work, break) minutes, as in Pomodoro._modes."""
+    daemon_threads = True
+
+    def __init__(self, logbook, modes, address=('', 12000),
+                 handler=ExportHandler):
+        ThreadingHTTPServer.__init__(self, address, handler)
+        self.logbook = logbook
+        self.modes = modes
+        self.exporter = Exporter(logbook, modes)
@@ -0,0 +1,244 @@
+"""Low overhead instrumentation for the bot's hot paths.
+
+Counters and histograms are registered once, at import time, in the module's
+REGISTRY and updated with a couple of arithmetic operations per event.
+Collectors are functions called at scrape time for values which are cheaper
+to read when asked for, such as the number of active sessions per channel.
+REGISTRY.render() produces the Prometheus text exposition format served at
+/metrics by the export server.
+
+Profiler wraps cProfile and a sampling profiler so the bot controller can
+switch either on and off at runtime."""
+import io
+import sys
+import time
+import bisect
+import threading
+from collections import Counter as Tally
+
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(name + '="' + str(value).replace("\\", "\\\\")
+                          .replace('"', '\\"').replace("\n", "\\n") + '"'
+                          for name, value in zip(names, values)) + "}"
+
+
+class Counter():
+    """Monotonically increasing count."""
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name + "_total" + labels, self.value
+
+
+class Histogram():
+    """Distribution of observed values over fixed bucket bounds."""
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        """Return a context manager observing the duration of its block."""
+        return _Timer(self)
+
+    def samples(self, name, labels):
+        cumulative = 0
+        prefix = labels[1:-1] + "," if labels else ""
+        for bound, count in zip(self.bounds + ("+Inf",), self.counts):
+            cumulative += count
+            yield (name + "_bucket{" + prefix + 'le="' + str(bound) + '"}',
+                   cumulative)
+        yield name + "_sum" + labels, self.sum
+        yield name + "_count" + labels, self.count
+
+
+class _Timer():
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Family():
+    """A metric with one child per combination of label values."""
+    def __init__(self, kind, name, help, label_names, factory):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._factory = factory
+        self._children = {}
+        if not label_names:
+            self._children[()] = factory()
+
+    def labels(self, *values):
+        """Return the child for the label <values>, creating it on first use."""
+        try:
+            return self._children[values]
+        except KeyError:
+            child = self._children[values] = self._factory()
+            return child
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            for sample in child.samples(self.name,
+                                        _label_text(self.label_names, values)):
+                yield sample
+
+
+class Registry():
+    """The set of metrics exposed at /metrics."""
+    def __init__(self):
+        self._families = {}
+        self._collectors = {}
+
+    def counter(self, name, help, labels=()):
+        return self._register(Family("counter", name, help, labels, Counter))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Family("histogram", name, help, labels,
+                                     lambda: Histogram(buckets)))
+
+    def _register(self, family):
+        """Register <family>, returning it, or its only child if it has no
+        labels so updates skip the label lookup."""
+        self._families[family.name] = family
+        if not family.label_names:
+            return family.labels()
+        return family
+
+    def collector(self, name, help, labels, function, kind="gauge"):
+        """Call function() at scrape time for (label values, value) pairs of
+        the metric <name>. Several collectors may report the same metric."""
+        if name not in self._collectors:
+            self._collectors[name] = (kind, help, labels, [])
+        self._collectors[name][3].append(function)
+
+    def remove_collector(self, name, function):
+        """Stop calling function() for the metric <name>."""
+        if name in self._collectors:
+            self._collectors[name][3].remove(function)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for name, family in sorted(self._families.items()):
+            lines.append("# HELP " + name + " " + family.help)
+            lines.append("# TYPE " + name + " " + family.kind)
+            for sample, value in family.samples():
+                lines.append(sample + " " + _number(value))
+        for name, (kind, help, labels, functions) in sorted(self._collectors.items()):
+            lines.append("# HELP " + name + " " + help)
+            lines.append("# TYPE " + name + " " + kind)
+            sample = name + "_total" if kind == "counter" else name
+            for function in list(functions):
+                for values, value in function():
+                    lines.append(sample + _label_text(labels, values) + " "
+                                 + _number(value))
+        return "\n".join(lines) + "\n"
+
+
+def stat_samples(stats, labels, counters, counted):
+    """Yield the (label values, value) pairs of a collector for the dict
+    <stats>, the statistic's name following the values <labels>. Only the
+    statistics named in <counters> are yielded if <counted>, only the others
+    otherwise, so a collector of each kind can share one stats() method."""
+    for statistic, value in stats.items():
+        if (statistic in counters) == counted:
+            yield labels + (statistic,), value
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+REGISTRY = Registry()
+
+
+class Profiler():
+    """Runtime switchable profiler of the bot's reactor thread.
+
+    In "cprofile" mode cProfile is enabled on the thread calling start(), in
+    "sampling" mode a background thread records the function at the top of
+    that thread's stack every <interval> seconds, which costs the bot almost
+    nothing. stop() returns a report of the top functions."""
+    def __init__(self, interval=0.005):
+        self._interval = interval
+        self.mode = None
+        self._profile = None
+        self._samples = None
+        self._sampler = None
+
+    def start(self, mode="cprofile"):
+        if self.mode:
+            return False
+        if mode == "sampling":
+            self._samples = Tally()
+            self._sampler = threading.Thread(
+                target=self._sample, args=(threading.get_ident(),), daemon=True)
+            self.mode = mode
+            self._sampler.start()
+        else:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self.mode = "cprofile"
+            self._profile.enable()
+        return True
+
+    def _sample(self, thread_id):
+        while self.mode == "sampling":
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                code = frame.f_code
+                self._samples[code.co_filename + ":" + str(frame.f_lineno)
+                              + " " + code.co_name] += 1
+            time.sleep(self._interval)
+
+    def stop(self, limit=10):
+        """Stop profiling and return the report as a list of lines."""
+        if self.mode == "sampling":
+            self.mode = None
+            self._sampler.join()
+            total = sum(self._samples.values()) or 1
+            return ["%5.1f%% %s" % (100 * count / total, location)
+                    for location, count in self._samples.most_common(limit)]
+        if self.mode == "cprofile":
+            self._profile.disable()
+            self.mode = None
+            import pstats
+            output = io.StringIO()
+            stats = pstats.Stats(self._profile, stream=output)
+            stats.sort_stats("cumulative").print_stats(limit)
+            return [line for line in output.getvalue().split("\n")
+                    if line.strip()]
+        return []
@@ -0,0 +1,269 @@
+"""Input recordings for the event system, see event_system_plan.md.
+
+Two recorders are available. TextRecorder writes the original tab separated
+format and flushes every message. BinaryRecorder writes length-prefixed binary
+records into rotating segment files, buffering them and flushing once
+flush_records are waiting or flush_interval seconds have passed. Each segment
+<base>.<n>.rec has a sidecar index <base>.<n>.idx mapping timestamps to file
+offsets, so read_binary can seek to a time window without scanning whole
+segments.
+
+Usage: python -m pomodoro_bot.recording convert <text recording> <binary base path>
+       python -m pomodoro_bot.recording dump <binary base path> [--since t] [--until t]"""
+import sys
+import glob
+import time
+import struct
+import bisect
+import argparse
+
+
+# Record header: total record length, timestamp, type code, and the byte
+# lengths of the nick and target. The contents take up the rest.
+RECORD_HEADER = struct.Struct(">IdBHH")
+# Index entry: timestamp of a record and its offset in the segment.
+INDEX_ENTRY = struct.Struct(">dQ")
+SEGMENT_MAGIC = b"PBREC\x01"
+
+TYPE_CODES = {"privmsg": 1, "pubmsg": 2}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+
+class TextRecorder():
+    """Recorder writing the tab separated text format, one flush per message."""
+    def __init__(self, path):
+        self._file = open(path, "w")
+
+    def record(self, type, nick, contents, target, timestamp=None):
+        """Record a message of <type> from <nick> to <target>."""
+        if timestamp is None:
+            timestamp = time.time()
+        self._file.write('\t'.join([str(timestamp), type, nick, contents,
+                                    target + "\n"]))
+        self._file.flush()
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class BinaryRecorder():
+    """Recorder writing buffered length-prefixed records to rotating segments.
+
+    Records are kept in memory until flush_records of them are waiting or
+    flush_interval seconds have passed since the last flush. A new segment is
+    started once the current one would grow beyond segment_bytes. Every
+    index_every-th record of a segment, and always its first, gets an entry
+    in the segment's index."""
+    def __init__(self, base, flush_records=256, flush_interval=5,
+                 segment_bytes=64 * 2**20, index_every=64, clock=time.time):
+        self._base = base
+        self._flush_records = flush_records
+        self._flush_interval = flush_interval
+        self._segment_bytes = segment_bytes
+        self._index_every = index_every
+        self._clock = clock
+        self._buffer = bytearray()
+        self._index_buffer = bytearray()
+        self._buffered = 0
+        self._last_flush = clock()
+        segments = segment_paths(base)
+        self._segment = int(segments[-1][-10:-4]) + 1 if segments else 0
+        self._open_segment()
+
+    def _open_segment(self):
+        """Start the next segment and its index."""
+        path = "%s.%06d" % (self._base, self._segment)
+        self._file = open(path + ".rec", "wb")
+        self._index = open(path + ".idx", "wb")
+        self._file.write(SEGMENT_MAGIC)
+        self._offset = len(SEGMENT_MAGIC)
+        self._records = 0
+
+    def record(self, type, nick, contents, target, timestamp=None):
+        """Record a message of <type> from <nick> to <target>."""
+        if timestamp is None:
+            timestamp = self._clock()
+        nick = nick.encode()
+        target = target.encode()
+        contents = contents.encode()
+        length = RECORD_HEADER.size + len(nick) + len(target) + len(contents)
+        if (self._records
+            and self._offset + len(self._buffer) + length > self._segment_bytes):
+            self.flush()
+            self._file.close()
+            self._index.close()
+            self._segment += 1
+            self._open_segment()
+        if self._records % self._index_every == 0:
+            self._index_buffer += INDEX_ENTRY.pack(
+                timestamp, self._offset + len(self._buffer))
+        self._buffer += RECORD_HEADER.pack(length, timestamp, TYPE_CODES[type],
+                                           len(nick), len(target))
+        self._buffer += nick + target + contents
+        self._records += 1
+        self._buffered += 1
+        if (self._buffered >= self._flush_records
+            or self._clock() - self._last_flush >= self._flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records and index entries to disk."""
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._file.flush()
+            self._offset += len(self._buffer)
+            self._buffer = bytearray()
+        if self._index_buffer:
+            self._index.write(self._index_buffer)
+            self._index.flush()
+            self._index_buffer = bytearray()
+        self._buffered = 0
+        self._last_flush = self._clock()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        self._index.close()
+
+
+def segment_paths(base):
+    """Return the paths of the segments of the binary recording <base> in
+    order."""
+    return sorted(glob.glob(glob.escape(base) + ".[0-9][0-9][0-9][0-9][0-9][0-9].rec"))
+
+
+def is_binary(path):
+    """Return whether <path> names a binary recording rather than a text one."""
+    return bool(segment_paths(path)) or path.endswith(".rec")
+
+
+def read_index(segment):
+    """Return the (timestamps, offsets) lists from the index of <segment>."""
+    timestamps = []
+    offsets = []
+    try:
+        index = open(segment[:-4] + ".idx", "rb")
+    except FileNotFoundError:
+        return timestamps, offsets
+    data = index.read()
+    index.close()
+    usable = len(data) - len(data) % INDEX_ENTRY.size
+    for timestamp, offset in INDEX_ENTRY.iter_unpack(data[:usable]):
+        timestamps.append(timestamp)
+        offsets.append(offset)
+    return timestamps, offsets
+
+
+def read_segment(segment, since=None, until=None):
+    """Yield the records of one segment within [since, until]."""
+    timestamps, offsets = read_index(segment)
+    start = len(SEGMENT_MAGIC)
+    if since is not None and timestamps:
+        position = bisect.bisect_left(timestamps, since) - 1
+        if position >= 0:
+            start = offsets[position]
+    infile = open(segment, "rb")
+    infile.seek(start)
+    while True:
+        header = infile.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            break
+        length, timestamp, code, nick_length, target_length = (
+            RECORD_HEADER.unpack(header))
+        body = infile.read(length - RECORD_HEADER.size)
+        if len(body) < length - RECORD_HEADER.size:
+            # A record torn by a crash mid-write.
+            break
+        if until is not None and timestamp > until:
+            break
+        if since is not None and timestamp < since:
+            continue
+        nick = body[:nick_length].decode()
+        target = body[nick_length:nick_length + target_length].decode()
+        contents = body[nick_length + target_length:].decode()
+        yield timestamp, TYPE_NAMES[code], nick, contents, target
+    infile.close()
+
+
+def read_binary(base, since=None, until=None):
+    """Yield (timestamp, type, nick, contents, target) records of the binary
+    recording <base> within [since, until]. Segments that end before <since>
+    are skipped using the first timestamp in the following segment's index."""
+    segments = segment_paths(base) if not base.endswith(".rec") else [base]
+    firsts = [read_index(segment)[0][:1] for segment in segments]
+    for position, segment in enumerate(segments):
+        following = firsts[position + 1] if position + 1 < len(firsts) else []
+        if since is not None and following and following[0] < since:
+            continue
+        if until is not None and firsts[position] and firsts[position][0] > until:
+            break
+        for record in read_segment(segment, since, until):
+            yield record
+
+
+def read_text(path):
+    """Yield (timestamp, type, nick, contents, target) records from a text
+    recording. Records written before the target was recorded have a target
+    of None."""
+    recording = open(path)
+    for line in recording:
+        fields = line.rstrip("\n").split("\t")
+        if len(fields) < 5:
+            continue
+        # Old records end in an empty field where the target now goes.
+        target = fields[-1] or None
+        yield (float(fields[0]), fields[1], fields[2],
+               "\t".join(fields[3:-1]), target)
+    recording.close()
+
+
+def read_recording(path, since=None, until=None):
+    """Yield the records of a text or binary recording."""
+    if is_binary(path):
+        return read_binary(path, since, until)
+    return (record for record in read_text(path)
+            if (since is None or record[0] >= since)
+            and (until is None or record[0] <= until))
+
+
+def convert_text(text_path, base, **options):
+    """Convert the text recording at <text_path> to a binary recording at
+    <base>, returning the number of records converted."""
+    recorder = BinaryRecorder(base, **options)
+    count = 0
+    for timestamp, type, nick, contents, target in read_text(text_path):
+        recorder.record(type, nick, contents, target or "", timestamp)
+        count += 1
+    recorder.close()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert and inspect pomodoro bot input recordings.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert",
+                                  help="Convert a text recording to binary.")
+    convert.add_argument("text_recording")
+    convert.add_argument("base")
+    dump = commands.add_parser("dump",
+                               help="Print a recording in the text format.")
+    dump.add_argument("recording")
+    dump.add_argument("--since", type=float)
+    dump.add_argument("--until", type=float)
+    arguments = parser.parse_args(argv)
+    if arguments.command == "convert":
+        count = convert_text(arguments.text_recording, arguments.base)
+        print("Converted", count, "records.")
+    else:
+        for timestamp, type, nick, contents, target in read_recording(
+                arguments.recording, arguments.since, arguments.until):
+            sys.stdout.write('\t'.join([str(timestamp), type, nick, contents,
+                                        (target or "") + "\n"]))
+
+
+if __name__ == "__main__":
+    main()
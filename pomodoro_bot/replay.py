@@ -0,0 +1,236 @@
+"""Replay an input recording written by python -m pomodoro_bot --log.
+
+The recording is fed back through PomodoroCommands using a stub connection and a
+virtual clock. Between two recorded messages the clock jumps straight to each
+pending phase deadline, so work and break periods take no real time and a
+month of channel activity replays in seconds. The resulting channel and
+logbook state is reported at the end, which makes a replay useful both as a
+regression harness and as a throughput benchmark of the bot's core logic."""
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import traceback
+
+from .commands import PomodoroCommands
+from .core import MessageQueue
+from .recording import read_recording
+
+
+class VirtualClock():
+    """Clock which only moves when the replay advances it."""
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Source():
+    """Stand-in for irc.client.NickMask, of which the bot only reads nick."""
+    def __init__(self, nick):
+        self.nick = nick
+
+
+class Event():
+    """Stand-in for irc.client.Event, so replaying doesn't import irc."""
+    def __init__(self, type, source, target, arguments):
+        self.type = type
+        self.source = source
+        self.target = target
+        self.arguments = arguments
+
+
+class ReplayConnection():
+    """Stand-in for the IRC connection which counts what the bot sends."""
+    def __init__(self, nickname):
+        self._nickname = nickname
+        self.channels = set()
+        self.notices = 0
+        self.notice_bytes = 0
+
+    def get_nickname(self):
+        return self._nickname
+
+    def join(self, channel):
+        self.channels.add(channel.lower())
+
+    def part(self, channel):
+        self.channels.discard(channel.lower())
+
+    def notice(self, target, text):
+        self.notices += 1
+        self.notice_bytes += len(text.encode())
+
+    def execute_every(self, period, function, arguments=()):
+        pass
+
+    def execute_delayed(self, delay, function, arguments=()):
+        pass
+
+
+class ReplayBot(PomodoroCommands):
+    """PomodoroCommands wired to a ReplayConnection and a VirtualClock.
+
+    Notices are not paced, and the controller's quit command commits the
+    logbook instead of exiting."""
+    def __init__(self, controller, nickname, work_logs, connection, clock):
+        PomodoroCommands.__init__(self, controller, nickname, connection,
+                                  "127.0.0.1", work_logs=work_logs,
+                                  clock=clock, network="localhost")
+        unlimited = float("inf")
+        self._outbox = MessageQueue(connection, rate=unlimited,
+                                    burst=unlimited, target_rate=unlimited,
+                                    target_burst=unlimited, clock=clock)
+
+    def do_quit(self, connection, event):
+        self._logbook.commit()
+
+
+class Replayer():
+    """Drive a ReplayBot through a sequence of recorded messages. Unless
+    <controller> is given, the author of the first private message is taken
+    to be the bot controller."""
+    def __init__(self, work_logs, controller=None, nickname="PomodoroBot"):
+        self._work_logs = work_logs
+        self._controller = controller
+        self._nickname = nickname
+        self._clock = VirtualClock()
+        self._connection = ReplayConnection(nickname)
+        self._bot = None
+        self._channel = None
+        self.events = 0
+        self.transitions = 0
+        self.errors = []
+        self.first_timestamp = None
+
+    def _start(self, timestamp):
+        self._clock.now = timestamp
+        self.first_timestamp = timestamp
+        self._bot = ReplayBot(self._controller, self._nickname,
+                              self._work_logs, self._connection, self._clock)
+
+    def advance(self, timestamp):
+        """Move the virtual clock to <timestamp>, firing every phase
+        transition due on the way at its own deadline."""
+        scheduler = self._bot._scheduler
+        while True:
+            deadline = scheduler.next_deadline()
+            if deadline is None or deadline > timestamp:
+                break
+            self._clock.now = max(self._clock.now, deadline)
+            self.transitions += scheduler.run_due()
+            self._bot._outbox.pump()
+        self._clock.now = max(self._clock.now, timestamp)
+
+    def feed(self, timestamp, type, nick, contents, target):
+        """Replay one recorded message."""
+        if self._bot is None:
+            self._start(timestamp)
+        self.advance(timestamp)
+        if type == "privmsg":
+            if self._bot._controller is None:
+                self._bot._controller = nick
+            words = contents.split()
+            if words[:1] == ["join"] and len(words) > 1:
+                self._channel = words[1].lower()
+            event = Event(type, Source(nick), target or self._nickname,
+                          [contents])
+            handler = self._bot.on_privmsg
+        elif type == "pubmsg":
+            event = Event(type, Source(nick), target or self._channel,
+                          [contents])
+            handler = self._bot.on_pubmsg
+            # The controller's join may be outside the replayed window, or
+            # the bot may have joined from a snapshot or its configuration.
+            if (event.target
+                and event.target.lower() not in self._bot._channel_table):
+                self._bot.join_channel(self._connection, event.target)
+        else:
+            return
+        self.events += 1
+        try:
+            handler(self._connection, event)
+        except Exception:
+            self.errors.append((timestamp, type, nick, contents,
+                                traceback.format_exc()))
+        self._bot._outbox.pump()
+
+    def run(self, records):
+        """Replay every record and return the report."""
+        start = time.perf_counter()
+        for record in records:
+            self.feed(*record)
+        wall = time.perf_counter() - start
+        return self.report(wall)
+
+    def report(self, wall):
+        """Return the channel and logbook state along with replay counters."""
+        if self._bot is None:
+            return {"events": 0}
+        logbook = self._bot._logbook
+        logbook.commit()
+        channels = {}
+        for channel, session in self._bot._channel_table.items():
+            if session is None:
+                channels[channel] = {"mode": None, "session": False,
+                                     "users": []}
+                continue
+            channels[channel] = {"mode": session.mode,
+                                 "session": session.session_running(),
+                                 "users": sorted(session.users())}
+        sessions = 0
+        for nick in logbook.nicks():
+            sessions += len(logbook.history(nick))
+        return {"events": self.events,
+                "errors": len(self.errors),
+                "phase_transitions": self.transitions,
+                "notices_sent": self._connection.notices,
+                "notice_bytes": self._connection.notice_bytes,
+                "virtual_seconds": round(self._clock.now - self.first_timestamp, 3),
+                "wall_seconds": round(wall, 3),
+                "events_per_second": round(self.events / wall) if wall else None,
+                "channels": channels,
+                "logbook": {"nicks": len(logbook.nicks()),
+                            "sessions": sessions}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay a pomodoro bot input recording.")
+    parser.add_argument("recording",
+                        help="The input recording written with --log, either a"
+                        + " text file or the base path of a binary recording.")
+    parser.add_argument("--since", type=float,
+                        help="Only replay messages from this Unix time on.")
+    parser.add_argument("--until", type=float,
+                        help="Only replay messages up to this Unix time.")
+    parser.add_argument("--controller",
+                        help="Nick of the bot controller. Defaults to the author"
+                        + " of the first private message.")
+    parser.add_argument("--nickname", default="PomodoroBot",
+                        help="The nickname the bot had when recording.")
+    parser.add_argument("--work-logs",
+                        help="Logbook directory to replay into. Defaults to a"
+                        + " fresh temporary directory.")
+    parser.add_argument("--errors", action="store_true",
+                        help="Print the traceback of every failed message.")
+    arguments = parser.parse_args(argv)
+    work_logs = arguments.work_logs or tempfile.mkdtemp(prefix="replay-")
+    if not os.path.isdir(work_logs):
+        os.mkdir(work_logs)
+    replayer = Replayer(work_logs, arguments.controller, arguments.nickname)
+    report = replayer.run(read_recording(arguments.recording,
+                                         arguments.since, arguments.until))
+    report["work_logs"] = work_logs
+    print(json.dumps(report, indent=2))
+    if arguments.errors:
+        for timestamp, type, nick, contents, trace in replayer.errors:
+            print(timestamp, type, nick, repr(contents), file=sys.stderr)
+            print(trace, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
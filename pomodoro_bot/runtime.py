@@ -0,0 +1,226 @@
+"""Serve several IRC networks from one process around a single WorkLogbook.
+
+The networks are described in a JSON file:
+
+{"work_logs": "work_logs",
+ "export_port": 12000,
+ "processes": 0,
+ "networks": [{"name": "libera",
+               "server": "irc.libera.chat",
+               "port": 6667,
+               "nickname": "PomodoroBot",
+               "controller": "alice",
+               "ip_address": "203.0.113.7",
+               "channels": ["#study", "#focus"],
+               "connections": 1}]}
+
+Every network gets one PomodoroBot per connection, each running on its own
+thread, and joins its channels once connected. A network's channels are split
+between its connections by a hash of the channel name, the second and later
+connections use the nickname followed by their number. Each connection
+snapshots its channels to .snapshot-<network>-<nickname>.json in the work
+logs directory and resumes from it on restart.
+
+With "processes" at 0 every bot runs in this process. Otherwise the
+connections are dealt out round robin to that many worker processes, spawned
+rather than forked, which reach the logbook through a multiprocessing manager
+served from this process.
+Either way there is only one WorkLogbook: this process loads it once, commits
+and compacts it, and serves it through the one export server. Metrics are per
+process, /metrics only shows the bots running in this one along with the
+logbook's cache counters and its I/O pool, reported as network="shared".
+
+Usage: python -m pomodoro_bot.runtime <networks.json>"""
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+from functools import partial
+from threading import Thread
+from multiprocessing import get_context
+from multiprocessing.managers import BaseManager
+
+from . import metrics
+from . import workers
+from . import export_server
+from .bot import PomodoroBot
+from .core import Pomodoro
+from .core import WorkLogbook
+
+
+# The WorkLogbook methods the bots call, as served to worker processes.
+LOGBOOK_METHODS = ("log_session", "commit", "compact", "summary", "search",
+                   "cache_stats")
+
+
+class LogbookManager(BaseManager):
+    """Manager serving this process's WorkLogbook to the worker processes."""
+
+
+def connections(network):
+    """Return the bot arguments of each connection to <network>."""
+    count = network.get("connections", 1)
+    channels = [[] for _ in range(count)]
+    for channel in network.get("channels", []):
+        channels[zlib.crc32(channel.lower().encode()) % count].append(channel)
+    specs = []
+    for number in range(count):
+        nickname = network["nickname"] + (str(number) if number else "")
+        specs.append({"network": network.get("name", network["server"]),
+                      "control_nick": network["controller"],
+                      "nickname": nickname,
+                      "server": network["server"],
+                      "ip_address": network["ip_address"],
+                      "port": network.get("port", 6667),
+                      "channels": channels[number]})
+    return specs
+
+
+def start_bots(specs, logbook, options):
+    """Start a PomodoroBot thread for each connection in <specs>. The bots
+    don't record their input, so they need no I/O threads of their own."""
+    threads = []
+    for spec in specs:
+        bot = PomodoroBot(spec["control_nick"], spec["nickname"],
+                          spec["server"], spec["ip_address"], spec["port"],
+                          commit_interval=options["commit_interval"],
+                          io_workers=0, logbook=logbook,
+                          channels=spec["channels"], network=spec["network"],
+                          snapshot=spec["snapshot"])
+        thread = Thread(target=bot.start, name=spec["network"] + "/"
+                        + spec["nickname"], daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def run_worker(address, authkey, specs, options):
+    """Entry point of a worker process running the bots for <specs>."""
+    LogbookManager.register("logbook")
+    manager = LogbookManager(address=address, authkey=authkey)
+    manager.connect()
+    for thread in start_bots(specs, manager.logbook(), options):
+        thread.join()
+
+
+class Runtime():
+    """The bots of every configured network, the shared logbook and the
+    export server."""
+    def __init__(self, config):
+        self._config = config
+        self._options = {
+            "commit_interval": config.get("commit_interval", 10),
+            "compact_interval": config.get("compact_interval", 3600),
+            "io_workers": config.get("io_workers", 4)}
+        work_logs = config.get("work_logs", "work_logs")
+        if not os.path.isdir(work_logs):
+            os.mkdir(work_logs)
+        self.pool = workers.WorkerPool(self._options["io_workers"],
+                                       config.get("io_queue_size", 1024))
+        self.logbook = WorkLogbook(
+            work_logs,
+            batch_size=config.get("batch_size", 64),
+            commit_interval=self._options["commit_interval"],
+            cache_size=config.get("cache_size", 1024),
+            pool=self.pool)
+        # The bots don't own the logbook or its pool, so they leave these out.
+        labels = ("network", "nickname", "statistic")
+        for collector in (
+                ("pomodoro_logbook_cache", "Logbook histories cached.",
+                 ("statistic",), partial(self._cache_samples, False), "gauge"),
+                ("pomodoro_logbook_cache_events",
+                 "Logbook history cache hits, misses and evictions.",
+                 ("statistic",), partial(self._cache_samples, True), "counter"),
+                ("pomodoro_io_pool", "Disk I/O worker pool queue length.",
+                 labels, partial(self._io_samples, False), "gauge"),
+                ("pomodoro_io_pool_tasks", "Disk I/O worker pool task counters.",
+                 labels, partial(self._io_samples, True), "counter")):
+            metrics.REGISTRY.collector(*collector)
+        self.specs = [spec for network in config["networks"]
+                      for spec in connections(network)]
+        for spec in self.specs:
+            spec["snapshot"] = os.path.join(
+                work_logs, ".snapshot-" + spec["network"] + "-"
+                + spec["nickname"] + ".json")
+        self.address = None
+        self.processes = []
+        self.threads = []
+
+    def _cache_samples(self, counted):
+        return metrics.stat_samples(self.logbook.cache_stats(), (),
+                                    WorkLogbook.cache_counters, counted)
+
+    def _io_samples(self, counted):
+        return metrics.stat_samples(self.pool.stats(), ("shared", ""),
+                                    workers.WorkerPool.counters, counted)
+
+    def start(self):
+        """Start the export server, then the bots in this process or in the
+        worker processes."""
+        httpd = export_server.ExportServer(
+            self.logbook, Pomodoro._modes, ("", self._config.get("export_port",
+                                                                 12000)))
+        Thread(target=httpd.serve_forever, daemon=True).start()
+        count = self._config.get("processes", 0)
+        if not count:
+            self.threads = start_bots(self.specs, self.logbook, self._options)
+            return
+        self.authkey = os.urandom(16)
+        LogbookManager.register("logbook", callable=lambda: self.logbook,
+                                exposed=LOGBOOK_METHODS)
+        manager = LogbookManager(address=("127.0.0.1", 0),
+                                 authkey=self.authkey)
+        server = manager.get_server()
+        self.address = server.address
+        Thread(target=server.serve_forever, daemon=True).start()
+        # This process already runs threads, a forked child would inherit
+        # their locks in whatever state they were in.
+        context = get_context("spawn")
+        for number in range(count):
+            process = context.Process(target=run_worker,
+                                      args=(self.address, self.authkey,
+                                            self.specs[number::count],
+                                            self._options),
+                                      name="pomodoro-worker-" + str(number),
+                                      daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    def maintain(self):
+        """Commit and compact the logbook on schedule until interrupted, then
+        compact it one last time and wait for the disk."""
+        commit_interval = self._options["commit_interval"]
+        compact_interval = self._options["compact_interval"]
+        last_compact = time.time()
+        try:
+            while True:
+                time.sleep(commit_interval)
+                if time.time() - last_compact >= compact_interval:
+                    self.logbook.compact()
+                    last_compact = time.time()
+                else:
+                    self.logbook.commit()
+        except KeyboardInterrupt:
+            pass
+        self.logbook.compact()
+        self.pool.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the pomodoro bot on several IRC networks.")
+    parser.add_argument("config", help="JSON file describing the networks.")
+    arguments = parser.parse_args(argv)
+    with open(arguments.config) as infile:
+        config = json.load(infile)
+    runtime = Runtime(config)
+    runtime.start()
+    print("Serving", len(runtime.specs), "connections to",
+          len(config["networks"]), "networks.", file=sys.stderr)
+    runtime.maintain()
+
+
+if __name__ == "__main__":
+    main()
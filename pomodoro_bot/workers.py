@@ -0,0 +1,170 @@
+"""Bounded worker pool for the bot's blocking disk I/O.
+
+The IRC reactor thread hands journal appends, log file rewrites and input
+recording writes to a WorkerPool instead of doing them itself, so a slow disk
+delays the writes rather than PINGs and every channel's commands.
+
+Tasks are submitted under a key. All tasks with the same key run on the same
+worker in submission order, which keeps each nick's journal appends and
+rewrites in order. Every worker has a bounded queue: once it is full submit()
+blocks until there is room, slowing the reactor down instead of letting the
+backlog grow without limit. close() waits for every queued task to finish.
+
+Reads which have to see a nick's files as its queued writes leave them are
+queued the same way with submit_result(), whose Result the caller waits on."""
+import sys
+import zlib
+import queue
+import threading
+
+
+class Result():
+    """The outcome of a task queued with WorkerPool.submit_result()."""
+    def __init__(self):
+        self._done = threading.Event()
+        self._value = None
+        self._error = None
+
+    def _run(self, function, arguments):
+        try:
+            self._value = function(*arguments)
+        except Exception as error:
+            self._error = error
+        finally:
+            self._done.set()
+
+    def result(self):
+        """Block until the task has run, then return its return value or
+        raise the exception it raised."""
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class WorkerPool():
+    """Run blocking tasks on <workers> threads, each with a queue of at most
+    <queue_size> tasks. With no workers tasks run inline in submit()."""
+    # The statistics which only ever grow, see metrics.stat_samples.
+    counters = ("submitted", "completed", "blocked", "failed")
+
+    def __init__(self, workers=4, queue_size=1024, name="io"):
+        self._queues = [queue.Queue(queue_size) for _ in range(workers)]
+        self._threads = [threading.Thread(target=self._work, args=(tasks,),
+                                          name=name + "-" + str(number),
+                                          daemon=True)
+                         for number, tasks in enumerate(self._queues)]
+        # Held while queueing, so close() can't slip its stop markers in
+        # between a submitter's check and its put.
+        self._submitting = threading.Lock()
+        self._lock = threading.Lock()
+        self._closed = not workers
+        self.submitted = 0
+        self.completed = 0
+        self.blocked = 0
+        self.failed = 0
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self, tasks):
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            self._run(*task)
+
+    def _run(self, function, arguments, counted=True):
+        try:
+            function(*arguments)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            print("I/O task", getattr(function, "__name__", function),
+                  "failed:", file=sys.stderr)
+            import traceback
+            traceback.print_exc()
+        if counted:
+            with self._lock:
+                self.completed += 1
+
+    def _queue(self, key):
+        return self._queues[zlib.crc32(key.encode()) % len(self._queues)]
+
+    def _put(self, tasks, task):
+        try:
+            tasks.put_nowait(task)
+        except queue.Full:
+            with self._lock:
+                self.blocked += 1
+            tasks.put(task)
+
+    def submit(self, key, function, *arguments):
+        """Queue function(*arguments) behind every earlier task with <key>."""
+        with self._lock:
+            self.submitted += 1
+        with self._submitting:
+            if not self._closed:
+                self._put(self._queue(key), (function, arguments))
+                return
+        self._run(function, arguments)
+
+    def submit_result(self, key, function, *arguments):
+        """Queue function(*arguments) like submit() and return a Result for
+        its outcome."""
+        result = Result()
+        self.submit(key, result._run, function, arguments)
+        return result
+
+    def submit_after_all(self, function, *arguments, counted=True):
+        """Queue function(*arguments) to run once every task submitted before
+        it has finished, and before any task submitted after it starts."""
+        if counted:
+            with self._lock:
+                self.submitted += 1
+        with self._submitting:
+            if not self._closed:
+                # Every worker stops at the barrier, the last to arrive runs
+                # the function before any of them moves on.
+                barrier = threading.Barrier(
+                    len(self._queues),
+                    action=lambda: self._run(function, arguments, counted))
+                for tasks in self._queues:
+                    self._put(tasks, (barrier.wait, (), False))
+                return
+        self._run(function, arguments, counted)
+
+    def wait(self, key):
+        """Block until every task submitted so far with <key> has finished."""
+        done = threading.Event()
+        with self._submitting:
+            if self._closed:
+                return
+            self._put(self._queue(key), (done.set, (), False))
+        done.wait()
+
+    def flush(self):
+        """Block until every task submitted so far has finished."""
+        done = threading.Event()
+        self.submit_after_all(done.set, counted=False)
+        done.wait()
+
+    def close(self):
+        """Finish every queued task and stop the workers. Tasks submitted
+        afterwards run inline."""
+        with self._submitting:
+            if self._closed:
+                return
+            self._closed = True
+            for tasks in self._queues:
+                tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self):
+        """Return the pool's task counters and current queue length."""
+        with self._lock:
+            return {"submitted": self.submitted,
+                    "completed": self.completed,
+                    "queued": self.submitted - self.completed,
+                    "blocked": self.blocked,
+                    "failed": self.failed}
@@ -0,0 +1,71 @@
+import pytest
+
+from pomodoro_bot.core import WorkLogbook
+from pomodoro_bot.replay import Event
+from pomodoro_bot.replay import ReplayConnection
+from pomodoro_bot.replay import Source
+from pomodoro_bot.replay import VirtualClock
+
+
+class Connection(ReplayConnection):
+    """ReplayConnection which also keeps every notice sent."""
+    def __init__(self, nickname="PomodoroBot"):
+        ReplayConnection.__init__(self, nickname)
+        self.sent = []
+
+    def notice(self, target, text):
+        ReplayConnection.notice(self, target, text)
+        self.sent.append((target, text))
+
+
+def message(nick, target, text, type="pubmsg"):
+    return Event(type, Source(nick), target, [text])
+
+
+@pytest.fixture
+def clock():
+    return VirtualClock(1460000000)
+
+
+@pytest.fixture
+def connection():
+    return Connection()
+
+
+@pytest.fixture
+def event():
+    """event(nick, target, text) builds a channel message, pass
+    type="privmsg" for a private one."""
+    return message
+
+
+@pytest.fixture
+def logbook(tmp_path, clock):
+    """logbook(pool=None, **options) opens the WorkLogbook in tmp_path."""
+    def open_logbook(pool=None, **options):
+        return WorkLogbook(str(tmp_path), clock=clock, pool=pool, **options)
+    return open_logbook
+
+
+@pytest.fixture
+def make_bot(tmp_path, clock):
+    """make_bot(**options) returns a PomodoroBot logging to tmp_path without
+    I/O threads, and the list of (target, text) notices it queues. The bots
+    are closed after the test."""
+    from pomodoro_bot.bot import PomodoroBot
+    bots = []
+
+    def make(**options):
+        options.setdefault("work_logs", str(tmp_path))
+        options.setdefault("io_workers", 0)
+        options.setdefault("clock", clock)
+        bot = PomodoroBot("controller", "PomodoroBot", "localhost",
+                          "127.0.0.1", **options)
+        notices = []
+        bot._outbox.notice = lambda target, text, *priority: notices.append(
+            (target, text))
+        bots.append(bot)
+        return bot, notices
+    yield make
+    for bot in bots:
+        bot.close()
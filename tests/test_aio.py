@@ -0,0 +1,84 @@
+import asyncio
+import threading
+
+from pomodoro_bot.aio import AioExportServer
+from pomodoro_bot.core import Pomodoro
+from pomodoro_bot.core import WorkLogbook
+from pomodoro_bot.workers import WorkerPool
+
+
+def test_export_of_a_cold_log_leaves_the_loop_free(tmp_path):
+    pool = WorkerPool(1)
+    book = WorkLogbook(str(tmp_path), batch_size=1, pool=pool)
+    book.log_session("alice", "fast", " one", "#study")
+    book.flush()
+    book = WorkLogbook(str(tmp_path), batch_size=1, pool=pool)
+    gate = threading.Event()
+    pool.submit("alice", gate.wait)
+    server = AioExportServer(book, Pomodoro._modes, ("127.0.0.1", 0))
+
+    async def scenario():
+        await server.start()
+        port = server._server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /alice.json HTTP/1.1\r\nConnection: close\r\n\r\n")
+        await asyncio.sleep(0.1)
+        # The export is waiting for the disk, the loop's own use of the
+        # logbook must not.
+        book.log_session("alice", "long", " two", "#study")
+        summary = book.summary("alice", "all", 1460000000)
+        gate.set()
+        response = await reader.read()
+        writer.close()
+        server._server.close()
+        return summary, response
+
+    summary, response = asyncio.run(asyncio.wait_for(scenario(), 10))
+    assert summary["sessions"] == 2
+    assert response.startswith(b"HTTP/1.1 200")
+    assert b'" one"' in response and b'" two"' in response
+    pool.close()
+
+
+def test_http_1_0_responses_are_not_chunked(tmp_path):
+    book = WorkLogbook(str(tmp_path))
+    book.log_session("alice", "fast", " one")
+    server = AioExportServer(book, Pomodoro._modes, ("127.0.0.1", 0))
+
+    async def scenario():
+        await server.start()
+        port = server._server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /alice.json HTTP/1.0\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+        server._server.close()
+        return response
+
+    response = asyncio.run(asyncio.wait_for(scenario(), 10))
+    head, _, content = response.partition(b"\r\n\r\n")
+    assert b"Transfer-Encoding" not in head
+    assert b"Connection: close" in head
+    assert content.startswith(b'[["') and content.endswith(b"]")
+
+
+def test_head_sends_no_body(tmp_path):
+    book = WorkLogbook(str(tmp_path))
+    book.log_session("alice", "fast", " one")
+    server = AioExportServer(book, Pomodoro._modes, ("127.0.0.1", 0))
+
+    async def scenario():
+        await server.start()
+        port = server._server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"HEAD /alice.json HTTP/1.1\r\nConnection: close\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+        server._server.close()
+        return response
+
+    response = asyncio.run(asyncio.wait_for(scenario(), 10))
+    head, _, content = response.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 200")
+    assert b"Transfer-Encoding: chunked" in head
+    assert content == b""
@@ -0,0 +1,178 @@
+import json
+
+
+def test_unknown_modes_are_rejected(make_bot, clock, connection, event):
+    bot, notices = make_bot()
+    bot.join_channel(connection, "#test")
+    bot.on_pubmsg(connection, event("alice", "#test", ".pomodoro bogus"))
+    assert len(bot._scheduler) == 0
+    assert "'bogus' is not a mode" in notices[-1][1]
+    bot.on_pubmsg(connection, event("alice", "#test", ".pomodoro fast"))
+    bot.on_pubmsg(connection, event("alice", "#test", ".register Reading"))
+    for phase in (300, 25 * 60):
+        clock.now += phase
+        bot._scheduler.run_due()
+    assert bot._channel_table["#test"].session_running() == "break"
+    bot.on_pubmsg(connection, event("alice", "#test", ".pomodoro bogus"))
+    assert not bot._channel_table["#test"].votes()
+    assert "'bogus' is not a mode" in notices[-1][1]
+
+
+def test_search_replies_to_a_long_query_fit_in_one_notice(make_bot,
+                                                           connection, event):
+    bot, notices = make_bot()
+    words = ["topic" + str(number) for number in range(200)]
+    for number in range(40):
+        bot._logbook.log_session("someone_with_a_long_nick" + str(number),
+                                 "fast", " ".join(words[number::40]),
+                                 "#test")
+    bot.join_channel(connection, "#test")
+    bot.on_pubmsg(connection, event("alice", "#test",
+                                    ".search " + " ".join(words)))
+    bot.on_pubmsg(connection, event("alice", "#test",
+                                    ".search " + "nothing " * 200))
+    assert len(notices) == 2
+    for target, text in notices:
+        assert len(("NOTICE " + target + " :" + text + "\r\n").encode()) < 512
+    assert notices[0][1].startswith("Matches for 'topic")
+    assert "..." in notices[0][1]
+
+
+def test_a_restored_session_fires_at_the_saved_deadline(make_bot, clock,
+                                                         connection, event,
+                                                         tmp_path):
+    snapshot = str(tmp_path / ".snapshot.json")
+    bot, notices = make_bot(snapshot=snapshot)
+    bot.join_channel(connection, "#a")
+    bot.join_channel(connection, "#quiet")
+    bot.on_pubmsg(connection, event("alice", "#a", ".pomodoro fast"))
+    bot.on_pubmsg(connection, event("alice", "#a", ".register Reading"))
+    deadline = bot._scheduler.next_deadline()
+    bot.save_snapshot()
+    clock.now += 60
+    restarted, notices = make_bot(snapshot=snapshot)
+    assert restarted._channel_table["#quiet"] is None
+    session = restarted._channel_table["#a"]
+    assert session.users() == {"alice": " Reading"}
+    assert restarted._scheduler.next_deadline() == deadline
+    clock.now = deadline - 1
+    assert restarted._scheduler.run_due() == 0
+    clock.now = deadline
+    assert restarted._scheduler.run_due() == 1
+    assert notices[-1][1].startswith("Pomodoro starts at")
+    # Dormant channels stay dormant through another save and restore.
+    restarted.save_snapshot()
+    with open(snapshot) as infile:
+        assert json.load(infile)["channels"]["#quiet"] is None
+    assert make_bot(snapshot=snapshot)[0]._channel_table["#quiet"] is None
+
+
+def test_a_stale_snapshot_only_restores_the_channels(make_bot, clock,
+                                                     connection, event,
+                                                     tmp_path):
+    snapshot = str(tmp_path / ".snapshot.json")
+    bot, notices = make_bot(snapshot=snapshot, snapshot_max_age=600)
+    bot.join_channel(connection, "#a")
+    bot.on_pubmsg(connection, event("alice", "#a", ".pomodoro fast"))
+    bot.save_snapshot()
+    clock.now += 601
+    restarted, notices = make_bot(snapshot=snapshot, snapshot_max_age=600)
+    assert restarted._channel_table == {"#a": None}
+    assert len(restarted._scheduler) == 0
+
+
+def test_dormant_channels_are_evicted_and_rehydrated(make_bot, clock,
+                                                     connection, event):
+    bot, notices = make_bot(dormant_after=3600)
+    bot.join_channel(connection, "#idle")
+    bot.join_channel(connection, "#busy")
+    bot.on_pubmsg(connection, event("alice", "#idle", ".registered"))
+    bot.on_pubmsg(connection, event("bob", "#busy", ".pomodoro long"))
+    clock.now += 3600
+    assert bot.evict_dormant() == 1
+    assert bot._channel_table["#idle"] is None
+    assert bot._channel_table["#busy"].session_running() == "work"
+    bot.on_pubmsg(connection, event("alice", "#idle", ".pomodoro fast"))
+    session = bot._channel_table["#idle"]
+    assert session.mode == "fast" and session.session_running() == "work"
+    assert session.active == clock.now
+    assert bot.evict_dormant() == 0
+
+
+def test_parting_a_channel_cancels_its_timer(make_bot, connection, event):
+    bot, notices = make_bot()
+    bot.join_channel(connection, "#a")
+    bot.on_pubmsg(connection, event("alice", "#a", ".pomodoro fast"))
+    assert len(bot._scheduler) == 1
+    bot.on_privmsg(connection, event("controller", "PomodoroBot", "part #A",
+                                     type="privmsg"))
+    assert "#a" not in bot._channel_table
+    assert "#a" not in connection.channels
+    assert len(bot._scheduler) == 0
+
+
+def test_a_mode_change_needs_a_vote_from_every_registered_user(make_bot,
+                                                               clock,
+                                                               connection,
+                                                               event):
+    bot, notices = make_bot()
+    bot.join_channel(connection, "#a")
+    bot.on_pubmsg(connection, event("alice", "#a", ".pomodoro fast"))
+    for nick in ("alice", "bob", "carol"):
+        bot.on_pubmsg(connection, event(nick, "#a", ".register Reading"))
+    for phase in (300, 25 * 60):
+        clock.now += phase
+        bot._scheduler.run_due()
+    for nick in ("alice", "bob"):
+        bot.on_pubmsg(connection, event(nick, "#a", ".register Writing"))
+    # The first request only calls the vote, then the votes are counted.
+    bot.on_pubmsg(connection, event("alice", "#a", ".pomodoro long"))
+    bot.on_pubmsg(connection, event("alice", "#a", ".pomodoro long"))
+    bot.on_pubmsg(connection, event("bob", "#a", ".pomodoro lazy"))
+    session = bot._channel_table["#a"]
+    assert session.mode == "fast"
+    assert session.votes() == {"long": {"alice"}, "lazy": {"bob"}}
+    bot.on_pubmsg(connection, event("bob", "#a", ".pomodoro long"))
+    session = bot._channel_table["#a"]
+    assert session.mode == "long" and session.session_running() == "work"
+    assert bot._scheduler.next_deadline() == clock.now
+
+
+def test_command_aliases(make_bot, connection, event):
+    bot, notices = make_bot()
+    bot.join_channel(connection, "#a")
+    bot.on_pubmsg(connection, event("alice", "#a", ".pomo fast"))
+    bot.on_pubmsg(connection, event("alice", "#a", ".reg Reading"))
+    bot.on_pubmsg(connection, event("bob", "#a", ".who"))
+    assert bot._channel_table["#a"].users() == {"alice": " Reading"}
+    assert notices[-1] == ("bob", "alice |  Reading")
+
+
+def test_commands_addressed_to_the_bot(make_bot, connection, event):
+    bot, notices = make_bot()
+    bot.join_channel(connection, "#a")
+    bot.on_pubmsg(connection, event("alice", "#a", "PomodoroBot: help"))
+    assert notices[0] == ("alice",
+                          "The PomodoroBot has the following commands:")
+    bot.on_pubmsg(connection, event("alice", "#a", "PomodoroBot pomo fast"))
+    assert bot._channel_table["#a"].mode == "fast"
+    del notices[:]
+    for text in ("PomodoroBot", "PomodoroBot:", "PomodoroBot: hello", " "):
+        assert bot.on_pubmsg(connection, event("alice", "#a", text)) is False
+    assert not notices
+
+
+class Unsplittable(str):
+    def split(self, *arguments):
+        raise AssertionError("chatter was split")
+
+
+def test_chatter_is_rejected_by_its_first_character(make_bot, connection,
+                                                    event):
+    bot, notices = make_bot()
+    bot.join_channel(connection, "#a")
+    for text in ("anyone around?", ":)", "lol", "Pomodoros are great"):
+        message = event("alice", "#a", Unsplittable(text))
+        assert bot.on_pubmsg(connection, message) is False
+    assert "a" not in bot._command_initials
+    assert not notices
@@ -0,0 +1,99 @@
+from pomodoro_bot.core import GoalIndex
+from pomodoro_bot.core import MessageQueue
+from pomodoro_bot.core import PhaseScheduler
+from pomodoro_bot.core import Pomodoro
+from pomodoro_bot.core import SessionLog
+
+
+def test_a_failing_transition_does_not_lose_the_rest_of_its_batch(clock, capsys):
+    scheduler = PhaseScheduler(clock=clock)
+    ran = []
+
+    def fail():
+        raise KeyError("bogus")
+    scheduler.schedule(1, fail)
+    scheduler.schedule(2, ran.append, ("second",))
+    clock.now += 5
+    assert scheduler.run_due() == 2
+    assert ran == ["second"]
+    assert len(scheduler) == 0
+    assert "fail" in capsys.readouterr().err
+
+
+def test_refilled_target_buckets_are_dropped(clock, connection):
+    outbox = MessageQueue(connection, rate=1000, burst=1000, clock=clock)
+    for number in range(500):
+        outbox.notice("user" + str(number), "hello")
+    outbox.pump()
+    assert len(connection.sent) == 500
+    outbox.notice("user0", "again")
+    clock.now += outbox.prune_interval
+    outbox.pump()
+    # user0 just spent a token, every other target has refilled.
+    assert list(outbox._buckets) == ["user0"]
+    clock.now += outbox.prune_interval
+    outbox.pump()
+    assert not outbox._buckets
+
+
+def test_a_line_over_the_limit_is_split_across_notices(clock, connection):
+    outbox = MessageQueue(connection, rate=1000, burst=1000,
+                          target_rate=1000, target_burst=1000, clock=clock)
+    words = ["word" + str(number) for number in range(300)]
+    outbox.notice("#test", " ".join(words))
+    outbox.notice("#test", "after")
+    while outbox.stats()["queued"]:
+        outbox.pump()
+    assert len(connection.sent) > 4
+    for target, text in connection.sent:
+        notice = "NOTICE " + target + " :" + text + "\r\n"
+        assert len(notice.encode()) + outbox.prefix_reserve <= outbox.max_line
+    sent = " // ".join(text for target, text in connection.sent)
+    assert sent.replace(" // ", " ").split() == words + ["after"]
+
+
+def test_a_notice_which_raises_is_dropped(clock, connection, capsys):
+    outbox = MessageQueue(connection, rate=1000, burst=1000, clock=clock)
+    send = connection.notice
+
+    def notice(target, text):
+        if target == "bad":
+            raise ValueError("too long")
+        send(target, text)
+    connection.notice = notice
+    outbox.notice("bad", "hello")
+    outbox.notice("good", "hello")
+    outbox.pump()
+    assert connection.sent == [("good", "hello")]
+    assert outbox.stats()["dropped"] == 1
+    assert "bad" in capsys.readouterr().err
+
+
+def test_session_logs_keep_modes_from_old_logs_to_themselves():
+    first = SessionLog()
+    second = SessionLog()
+    for number in range(300):
+        first.append(1460000000 + number, "mode" + str(number), " goal")
+        second.append(1460000000 + number, "fast", None)
+    assert [session.type for session in first] == [
+        "mode" + str(number) for number in range(300)]
+    assert first[-1].type == "mode299"
+    assert set(session.type for session in second) == {"fast"}
+    assert SessionLog._mode_names == tuple(Pomodoro._modes)
+
+
+def test_goal_index_ranks_by_words_matched_then_weight(tmp_path):
+    index = GoalIndex(str(tmp_path / ".goal_index.jsonl"))
+    for nick, goal in (("alice", "thesis and graphs"), ("bob", "thesis"),
+                       ("bob", "my thesis"), ("carol", "graphs"),
+                       ("carol", "graphs"), ("carol", "the graphs"),
+                       ("dave", "cooking")):
+        index.add(nick, goal)
+    results = index.search("The thesis, graphs")
+    assert [result["nick"] for result in results] == ["alice", "carol", "bob"]
+    assert results[0]["words"] == ["graphs", "thesis"]
+    assert results[2]["sessions"] == [0, 1]
+    assert results[1]["score"] > results[2]["score"]
+    assert [result["nick"] for result in index.search("graphs thesis",
+                                                      limit=1)] == ["alice"]
+    assert index.search("the and") == []
@@ -0,0 +1,73 @@
+import json
+import socket
+import threading
+
+from pomodoro_bot.core import Pomodoro
+from pomodoro_bot.core import WorkLogbook
+from pomodoro_bot.export_server import Exporter
+from pomodoro_bot.export_server import ExportServer
+
+
+def body(response):
+    return b"".join(response[2])
+
+
+def test_overall_stats_of_an_empty_logbook(tmp_path):
+    exporter = Exporter(WorkLogbook(str(tmp_path)), Pomodoro._modes)
+    status, headers, _ = response = exporter.respond("/stats", {})
+    assert status == 200
+    summary = json.loads(body(response))
+    assert summary["sessions"] == 0 and summary["streak"] == 0
+
+
+def fetch(port, request):
+    connection = socket.create_connection(("127.0.0.1", port), timeout=10)
+    connection.sendall(request)
+    response = b""
+    while True:
+        data = connection.recv(65536)
+        if not data:
+            break
+        response += data
+    connection.close()
+    return response
+
+
+def test_http_1_0_responses_are_not_chunked(tmp_path):
+    book = WorkLogbook(str(tmp_path))
+    book.log_session("alice", "fast", " one")
+    server = ExportServer(book, Pomodoro._modes, ("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    response = fetch(port, b"GET /alice.json HTTP/1.0\r\n\r\n")
+    head, _, content = response.partition(b"\r\n\r\n")
+    assert b"Transfer-Encoding" not in head
+    assert b"Connection: close" in head
+    assert json.loads(content)[0][2] == " one"
+    response = fetch(port, b"GET /alice.json HTTP/1.1\r\nConnection: close"
+                     b"\r\n\r\n")
+    assert b"Transfer-Encoding: chunked" in response
+    server.shutdown()
+    server.server_close()
+
+
+def test_head_sends_the_headers_of_a_get(tmp_path):
+    book = WorkLogbook(str(tmp_path))
+    book.log_session("alice", "fast", " one")
+    server = ExportServer(book, Pomodoro._modes, ("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    for path in (b"/alice.json", b"/metrics"):
+        get = fetch(port, b"GET " + path + b" HTTP/1.1\r\nConnection: close"
+                    b"\r\n\r\n").partition(b"\r\n\r\n")[0]
+        response = fetch(port, b"HEAD " + path + b" HTTP/1.1\r\n"
+                         b"Connection: close\r\n\r\n")
+        head, _, content = response.partition(b"\r\n\r\n")
+        assert head.startswith(b"HTTP/1.1 200")
+        assert content == b""
+        assert ([line for line in head.split(b"\r\n")
+                 if not line.startswith(b"Date:")]
+                == [line for line in get.split(b"\r\n")
+                    if not line.startswith(b"Date:")])
+    server.shutdown()
+    server.server_close()
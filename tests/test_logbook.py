@@ -0,0 +1,201 @@
+import os
+import json
+import threading
+
+from pomodoro_bot.workers import WorkerPool
+
+
+def test_history_is_loaded_without_holding_the_lock(logbook):
+    pool = WorkerPool(1)
+    book = logbook(pool, batch_size=1)
+    book.log_session("alice", "fast", " one")
+    book.flush()
+    book = logbook(pool, batch_size=1)
+    # Hold the I/O thread so the history read waits behind it.
+    gate = threading.Event()
+    pool.submit("alice", gate.wait)
+    loaded = []
+    reader = threading.Thread(target=lambda: loaded.append(book.history("alice")))
+    reader.start()
+    book.log_session("alice", "long", " two")
+    book.log_session("alice", "lazy", " three")
+    assert book.summary("alice", "all", 1460000000)["sessions"] == 3
+    gate.set()
+    reader.join()
+    assert [session.goal for session in loaded[0]] == [" one", " two", " three"]
+    book.log_session("alice", "fast", " four")
+    book.flush()
+    assert len(book.history("alice")) == 4
+    assert len(logbook().history("alice")) == 4
+    pool.close()
+
+
+def test_compaction_folds_journals_without_loading_histories(logbook, tmp_path):
+    pool = WorkerPool(2)
+    book = logbook(pool)
+    for goal in (" one", " two", " three"):
+        book.log_session("alice", "fast", goal)
+    book.compact()
+    book.flush()
+    assert book.cache_stats()["misses"] == 0
+    assert not os.path.exists(os.path.join(str(tmp_path), "alice.jsonl"))
+    with open(os.path.join(str(tmp_path), "alice.json")) as infile:
+        log = json.load(infile)
+    assert [record[2] for record in log["sessions"]] == [" one", " two",
+                                                         " three"]
+    assert len(logbook().history("alice")) == 3
+    pool.close()
+
+
+class Crash(BaseException):
+    """Stands in for the process dying, nothing catches it."""
+
+
+def test_crash_between_compaction_and_journal_removal(logbook, tmp_path,
+                                                      monkeypatch):
+    book = logbook()
+    for goal in (" one", " two", " three"):
+        book.log_session("alice", "fast", goal, "#study")
+
+    def crash(path):
+        raise Crash()
+    monkeypatch.setattr(os, "remove", crash)
+    try:
+        book.compact()
+    except Crash:
+        pass
+    monkeypatch.undo()
+    assert os.path.exists(os.path.join(str(tmp_path), "alice.jsonl"))
+    book = logbook()
+    assert [session.goal for session in book.history("alice")] == [
+        " one", " two", " three"]
+    assert book.summary("alice", "all", 1460000000)["sessions"] == 3
+    # Sessions logged after the restart go to the same journal and are not
+    # mistaken for folded ones.
+    book.log_session("alice", "long", " four", "#study")
+    book.compact()
+    book = logbook()
+    assert not os.path.exists(os.path.join(str(tmp_path), "alice.jsonl"))
+    assert [session.goal for session in book.history("alice")] == [
+        " one", " two", " three", " four"]
+    assert book.summary("alice", "all", 1460000000)["sessions"] == 4
+
+
+def test_append_after_a_torn_journal_line(logbook, tmp_path):
+    book = logbook()
+    book.log_session("alice", "fast", " one")
+    book.flush()
+    with open(os.path.join(str(tmp_path), "alice.jsonl"), "a") as journal:
+        journal.write('["2016-04-07T03-33-20Z", "fa')
+    book = logbook()
+    book.log_session("alice", "long", " two")
+    book.flush()
+    assert [session.goal for session in logbook().history("alice")] == [
+        " one", " two"]
+
+
+def test_log_files_from_before_journal_ids(logbook, tmp_path):
+    with open(os.path.join(str(tmp_path), "alice.json"), "w") as log:
+        json.dump([["2016-04-07T03-33-20Z", "fast", " one"]], log)
+    with open(os.path.join(str(tmp_path), "alice.jsonl"), "w") as journal:
+        journal.write('["2016-04-08T03-33-20Z", "long", " two"]\n')
+    book = logbook()
+    assert len(book.history("alice")) == 2
+    book.log_session("alice", "fast", " three")
+    book.compact()
+    assert [session.goal for session in logbook().history("alice")] == [
+        " one", " two", " three"]
+
+
+def test_channel_stats_survive_an_unclean_restart(logbook, tmp_path):
+    book = logbook()
+    book.log_session("alice", "fast", " one", "#Study")
+    book.compact()
+    for goal in (" two", " three", " four"):
+        book.log_session("bob", "fast", goal, "#study")
+    book.flush()
+    assert logbook().summary("#study", "all", 1460000000)["sessions"] == 4
+    os.remove(os.path.join(str(tmp_path), ".stats.json"))
+    book = logbook()
+    assert book.summary("#study", "all", 1460000000)["sessions"] == 4
+    book.compact()
+    assert logbook().summary("#study", "all", 1460000000)["sessions"] == 4
+
+
+def test_stats_are_saved_once_per_compaction(logbook, clock, tmp_path,
+                                             monkeypatch):
+    from pomodoro_bot import core
+    saved = []
+    replace_file = core.replace_file
+
+    def replace(path, text, obsolete=None):
+        if path.endswith(".stats.json"):
+            saved.append(json.loads(text))
+        replace_file(path, text, obsolete)
+    monkeypatch.setattr(core, "replace_file", replace)
+    book = logbook()
+    for day in range(10):
+        book.log_session("alice", "fast", " one", "#study")
+        clock.now += 86400
+    book.compact()
+    assert len(saved) == 1
+    assert len(saved[0]["stats"]["nicks"]["alice"]["daily"]) == 1
+    # The journal begun after the save is counted in full on a restart.
+    book.log_session("alice", "fast", " two", "#study")
+    book.log_session("alice", "fast", " three", "#study")
+    book.flush()
+    book = logbook()
+    assert book.summary("alice", "all", clock.now)["sessions"] == 12
+    assert book.summary("alice", "today", clock.now)["sessions"] == 2
+
+
+def test_history_cache_evicts_the_least_recently_used(logbook):
+    book = logbook(cache_size=2)
+    for nick in ("alice", "bob", "carol"):
+        book.log_session(nick, "fast", " " + nick)
+    book.flush()
+    book = logbook(cache_size=2)
+    book.history("alice")
+    book.history("bob")
+    book.history("alice")
+    book.history("carol")
+    assert list(book._logbook) == ["alice", "carol"]
+    assert book.cache_stats() == {"hits": 1, "misses": 3, "evictions": 1,
+                                  "loaded": 2}
+    assert [session.goal for session in book.history("bob")] == [" bob"]
+    assert list(book._logbook) == ["carol", "bob"]
+    assert book.cache_stats()["evictions"] == 2
+
+
+def test_goal_index_file_matches_a_full_rebuild(logbook, tmp_path):
+    book = logbook()
+    for nick, goal in (("alice", " thesis graphs"), ("bob", " the thesis"),
+                       ("carol", " graphs"), ("alice", " cooking"),
+                       ("bob", None)):
+        book.log_session(nick, "fast", goal)
+    book.compact()
+    book.log_session("carol", "fast", " more graphs")
+    book.flush()
+    loaded = logbook()
+    os.remove(os.path.join(str(tmp_path), ".goal_index.jsonl"))
+    rebuilt = logbook()
+    assert os.path.exists(os.path.join(str(tmp_path), ".goal_index.jsonl"))
+    for text in ("thesis graphs", "graphs", "cooking", "nothing"):
+        assert loaded.search(text) == rebuilt.search(text) == book.search(text)
+    assert loaded.goals.sessions == rebuilt.goals.sessions == 6
+
+
+def test_replaced_files_reach_the_disk_before_the_journal_goes(tmp_path,
+                                                               monkeypatch):
+    from pomodoro_bot import core
+    calls = []
+    for name in ("fsync", "replace", "remove"):
+        def traced(*arguments, name=name, function=getattr(os, name)):
+            calls.append(name)
+            return function(*arguments)
+        monkeypatch.setattr(os, name, traced)
+    journal = tmp_path / "alice.jsonl"
+    journal.write_text("[]\n")
+    core.replace_file(str(tmp_path / "alice.json"), "[]", str(journal))
+    assert calls == ["fsync", "replace", "fsync", "remove"]
+    assert not journal.exists()
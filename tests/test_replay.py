@@ -0,0 +1,27 @@
+from pomodoro_bot.replay import Replayer
+
+
+def test_channels_are_joined_when_their_join_was_not_recorded(tmp_path):
+    replayer = Replayer(str(tmp_path))
+    report = replayer.run([
+        (1001, "pubmsg", "alice", ".pomodoro fast", "#a"),
+        (1002, "pubmsg", "alice", ".register Reading", "#a"),
+        (1003, "pubmsg", "alice", ".registered", "#a")])
+    assert report["errors"] == 0
+    assert report["channels"]["#a"]["users"] == ["alice"]
+
+
+def test_the_controller_is_the_author_of_the_first_private_message(tmp_path):
+    replayer = Replayer(str(tmp_path))
+    report = replayer.run([
+        (1000, "privmsg", "controller", "join #a", None),
+        (1001, "pubmsg", "alice", ".pomodoro fast", "#a"),
+        (1002, "privmsg", "alice", "join #b", None),
+        (1003, "privmsg", "controller", "join #c", None)])
+    assert sorted(report["channels"]) == ["#a", "#c"]
+    replayer = Replayer(str(tmp_path))
+    report = replayer.run([
+        (1001, "pubmsg", "alice", ".pomodoro fast", "#a"),
+        (1002, "privmsg", "controller", "join #b", None),
+        (1003, "privmsg", "alice", "join #c", None)])
+    assert sorted(report["channels"]) == ["#a", "#b"]
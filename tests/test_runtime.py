@@ -0,0 +1,36 @@
+from pomodoro_bot import metrics
+from pomodoro_bot.bot import PomodoroBot
+from pomodoro_bot.runtime import Runtime
+
+
+def test_metrics_of_several_bots_have_no_duplicate_series(tmp_path):
+    networks = [{"name": name, "server": "irc." + name + ".example",
+                 "nickname": "PomodoroBot", "controller": "alice",
+                 "ip_address": "203.0.113.7", "channels": ["#study", "#focus"],
+                 "connections": 2}
+                for name in ("first-net", "second-net")]
+    runtime = Runtime({"work_logs": str(tmp_path), "io_workers": 1,
+                       "networks": networks})
+    bots = [PomodoroBot(spec["control_nick"], spec["nickname"], spec["server"],
+                        spec["ip_address"], spec["port"], io_workers=0,
+                        logbook=runtime.logbook, channels=spec["channels"],
+                        network=spec["network"])
+            for spec in runtime.specs]
+    series = [line.rpartition(" ")[0]
+              for line in metrics.REGISTRY.render().splitlines()
+              if not line.startswith("#")]
+    ours = [line for line in series
+            if "-net" in line or 'network="shared"' in line]
+    assert len(ours) == len(set(ours))
+    assert any(line.startswith('pomodoro_io_pool{network="second-net"')
+               for line in ours)
+    assert any(line.startswith('pomodoro_io_pool{network="shared"')
+               for line in ours)
+    assert 'pomodoro_logbook_cache_events_total{statistic="misses"}' in series
+    assert ('pomodoro_outbox_messages_total{network="first-net",'
+            'nickname="PomodoroBot",statistic="sent"}') in series
+    assert "# TYPE pomodoro_io_pool_tasks counter" in metrics.REGISTRY.render()
+    for bot in bots:
+        bot.close()
+    assert "-net" not in metrics.REGISTRY.render()
+    runtime.pool.close()